@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""启动耗时基准测试
+
+使用 python -X importtime 测量导入主程序和签到模块的耗时，
+并检查导入过程是否在工作目录中产生了文件（配置、日志、账号、历史记录）。
+
+用法:
+    python benchmarks/startup.py            # 输出测量结果
+    python benchmarks/startup.py --check    # 超出预算时返回非零退出码
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT_DIR, 'benchmarks', 'baselines.json')
+
+# 需要测量的导入目标
+IMPORT_TARGETS = {
+    'import_main': 'main',
+    'import_signer': 'modules.signer',
+}
+
+def measure_import(module, repeat=5):
+    """在干净的临时目录中测量模块导入的累计耗时（微秒），返回最小值和产生的文件"""
+    samples = []
+    created = set()
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR, PYTHONDONTWRITEBYTECODE='1')
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as work_dir:
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                cwd=work_dir, env=env, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"导入 {module} 失败: {result.stderr.strip().splitlines()[-1]}")
+            created.update(os.listdir(work_dir))
+            samples.append(_cumulative_time(result.stderr, module))
+    return min(samples), sorted(created)
+
+def _cumulative_time(output, module):
+    """从 -X importtime 的输出中提取指定模块的累计耗时"""
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = [part.strip() for part in line[len('import time:'):].split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1])
+    raise RuntimeError(f"未在importtime输出中找到模块: {module}")
+
+def measure_cli(repeat=5):
+    """测量 main.py --help 的墙钟耗时（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as work_dir:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(ROOT_DIR, 'main.py'), '--help'],
+                           cwd=work_dir, capture_output=True, check=True)
+            samples.append((time.perf_counter() - start) * 1000)
+    return min(samples)
+
+def run():
+    """执行全部启动基准，返回 {指标名: 数值}"""
+    metrics = {}
+    side_effects = {}
+    for name, module in IMPORT_TARGETS.items():
+        metrics[f'{name}_us'], side_effects[name] = measure_import(module)
+    metrics['cli_help_ms'] = round(measure_cli(), 2)
+    return metrics, side_effects
+
+def check(metrics, side_effects, budgets):
+    """对比预算，返回失败信息列表"""
+    failures = []
+    for name, files in side_effects.items():
+        if files:
+            failures.append(f"{name}: 导入时产生了文件 {files}")
+    for name, value in metrics.items():
+        budget = budgets.get(name)
+        if budget is not None and value > budget:
+            failures.append(f"{name}: {value} 超出预算 {budget}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时基准测试')
+    parser.add_argument('--check', action='store_true', help='超出预算时返回非零退出码')
+    args = parser.parse_args()
+
+    metrics, side_effects = run()
+    for name, value in metrics.items():
+        print(f"{name}: {value}")
+
+    if not args.check:
+        return 0
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        budgets = json.load(f).get('startup', {})
+    failures = check(metrics, side_effects, budgets)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""热点路径微基准测试
+
+覆盖以下几组基准，结果与 benchmarks/baselines.json 中的基线对比：
+- parsing:  用 fixtures/ 中的论坛页面测量签到模块的页面解析函数（微秒/次）
+- history:  在1千到100万条记录的历史数据上测量 add_sign_record（含保存）和冷启动查询（毫秒/次）
+- accounts: 测量 AccountManager.load_accounts 加载大账号文件（毫秒/次）
+- startup:  复用 startup.py 测量模块导入和命令行启动耗时
+
+历史记录和账号文件按固定随机种子在临时目录中生成，不需要签入大文件。
+
+用法:
+    python benchmarks/suite.py                        # 运行全部基准并输出结果
+    python benchmarks/suite.py --only parsing,history # 只运行指定分组
+    python benchmarks/suite.py --check                # 取3次运行的中位数，超出基线容差时返回非零退出码
+    python benchmarks/suite.py --check --runs 1       # 只运行一次，快速但更容易受抖动影响
+    python benchmarks/suite.py --update               # 用5次运行的中位数更新基线
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import date, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT_DIR, 'benchmarks')
+FIXTURES_DIR = os.path.join(BENCH_DIR, 'fixtures')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baselines.json')
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+GROUPS = ('parsing', 'history', 'accounts', 'startup')
+# 默认容差：超过基线50%视为回退，共享机器上的计时抖动通常在20%~30%
+DEFAULT_TOLERANCE = 0.5
+# 默认运行次数，每个指标取各次结果的中位数；单次运行之间的抖动可达50%以上
+CHECK_RUNS = 3
+UPDATE_RUNS = 5
+HISTORY_SIZES = (1000, 10000, 100000, 1000000)
+ACCOUNT_SIZES = (1000, 100000)
+# 生成历史数据时的账号数，记录按天平均分布到各账号
+HISTORY_ACCOUNTS = 1000
+
+def read_fixture(name):
+    """读取页面夹具"""
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+def best_of(func, repeat=5, min_time=0.1):
+    """返回最快一轮的单次平均耗时（秒）
+
+    与timeit.autorange相同，先加倍每轮的执行次数直到一轮不少于min_time秒，
+    避免耗时很短的基准受计时误差影响。
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return min(samples)
+
+def bench_parsing():
+    """页面解析基准（微秒/次）"""
+    from modules.signer import (parse_html, is_signed_page, parse_sign_stats, extract_formhash,
+                                parse_sign_response, extract_seccode_src)
+    home_page = read_fixture('home_page.html')
+    login_page = read_fixture('login_page.html')
+    sign_page = read_fixture('sign_page.html')
+    sign_response = read_fixture('sign_response.xml')
+
+    def parse_login_form():
+        # 与 DzSigner.login 中的表单查找一致
+        soup = parse_html(login_page)
+        for name in ('username', 'password', 'formhash', 'cookietime', 'seccodeverify'):
+            soup.find('input', {'name': name})
+
+    cases = {
+        'login_form': parse_login_form,
+        'is_signed_page': lambda: is_signed_page(sign_page),
+        'sign_stats': lambda: parse_sign_stats(sign_page),
+        'home_formhash': lambda: extract_formhash(home_page),
+        'sign_response': lambda: parse_sign_response(sign_response),
+        'seccode_src': lambda: extract_seccode_src(login_page),
+    }
+    return {f'{name}_us': round(best_of(func) * 1e6, 2) for name, func in cases.items()}
+
+def _reset_history_manager():
+    """清空历史记录管理器的内存状态，模拟新进程首次访问"""
+    from modules.history_manager import history_manager
+    history_manager._history_data = None
+    history_manager._partitions = {}
+    history_manager._dirty_partitions = set()
+    return history_manager
+
+def _write_legacy_history(path, size):
+    """生成旧版单文件格式的历史记录，共size条，按天分布在HISTORY_ACCOUNTS个账号上"""
+    rng = random.Random(size)
+    accounts_count = min(HISTORY_ACCOUNTS, size)
+    days = size // accounts_count
+    start = date.today() - timedelta(days=days)
+    accounts = {}
+    for index in range(accounts_count):
+        history = []
+        for day in range(days):
+            history.append({
+                "date": (start + timedelta(days=day)).isoformat(),
+                "time": f"08:{rng.randrange(60):02d}:{rng.randrange(60):02d}",
+                "status": "success",
+                "consecutive_days": day + 1,
+                "rank": rng.randrange(1, 5000),
+                "level": 7,
+                "reward": rng.randrange(1, 6),
+                "total_days": day + 1
+            })
+        accounts[f'user{index:05d}'] = {
+            "history": history,
+            "last_sign": history[-1]["date"],
+            "consecutive_days": days,
+            "total_days": days
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"accounts": accounts, "summary": {}}, f, ensure_ascii=False)
+
+def bench_history(sizes):
+    """历史记录基准（毫秒/次）"""
+    from modules.config_manager import config_manager
+    metrics = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            history_file = os.path.join(work_dir, 'sign_history.json')
+            config_manager.get_config().setdefault('paths', {})['history_file'] = history_file
+            _write_legacy_history(history_file, size)
+            # 首次加载时完成迁移，不计入耗时
+            _reset_history_manager().history_data
+
+            def cold_latest():
+                _reset_history_manager().get_latest_record('user00000')
+
+            def add_record():
+                history_manager.add_sign_record('user00000', {"status": "success", "连续签到": 1, "积分奖励": 3})
+
+            history_manager = _reset_history_manager()
+            metrics[f'history_add_{size}_ms'] = round(best_of(add_record, repeat=3) * 1000, 3)
+            metrics[f'history_cold_latest_{size}_ms'] = round(best_of(cold_latest, repeat=3) * 1000, 3)
+            _reset_history_manager()
+    return metrics
+
+def bench_accounts(sizes):
+    """账号加载基准（毫秒/次）"""
+    from modules.config_manager import config_manager
+    from modules.account_manager import account_manager
+    metrics = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            accounts_file = os.path.join(work_dir, 'accounts.json')
+            config_manager.get_config().setdefault('paths', {})['accounts_file'] = accounts_file
+            accounts = [{"username": f"user{index:06d}", "password": f"password{index}", "questionid": index % 8,
+                         "answer": "答案" if index % 8 else ""} for index in range(size)]
+            with open(accounts_file, 'w', encoding='utf-8') as f:
+                json.dump(accounts, f, ensure_ascii=False, indent=4)
+            metrics[f'accounts_load_{size}_ms'] = round(best_of(account_manager.load_accounts) * 1000, 3)
+    return metrics
+
+def bench_startup():
+    """启动耗时基准，见 startup.py"""
+    import startup
+    metrics, side_effects = startup.run()
+    for name, files in side_effects.items():
+        if files:
+            raise RuntimeError(f"{name}: 导入时产生了文件 {files}")
+    return metrics
+
+def run(groups, history_sizes=HISTORY_SIZES, account_sizes=ACCOUNT_SIZES):
+    """执行指定分组的基准，返回 {分组: {指标名: 数值}}"""
+    import logging
+    # 基准过程中的日志只会干扰输出
+    logging.getLogger('mt_sign').disabled = True
+    work_dir = tempfile.mkdtemp(prefix='mt_bench_')
+    cwd = os.getcwd()
+    # 在临时目录中运行，避免生成或迁移仓库中的配置、日志和历史文件
+    os.chdir(work_dir)
+    try:
+        results = {}
+        for group in groups:
+            if group == 'parsing':
+                results[group] = bench_parsing()
+            elif group == 'history':
+                results[group] = bench_history(history_sizes)
+            elif group == 'accounts':
+                results[group] = bench_accounts(account_sizes)
+            elif group == 'startup':
+                results[group] = bench_startup()
+        return results
+    finally:
+        os.chdir(cwd)
+
+def run_median(groups, runs, history_sizes=HISTORY_SIZES):
+    """执行runs次基准，每个指标取中位数"""
+    samples = {}
+    for _ in range(max(1, runs)):
+        for group, metrics in run(groups, history_sizes).items():
+            for name, value in metrics.items():
+                samples.setdefault(group, {}).setdefault(name, []).append(value)
+    return {group: {name: round(statistics.median(values), 3) for name, values in metrics.items()}
+            for group, metrics in samples.items()}
+
+def check(results, baselines, tolerance, tolerances=None):
+    """对比基线，返回失败信息列表；没有基线的指标只输出不检查
+
+    Args:
+        tolerance: 默认容差比例
+        tolerances: 按指标设置的容差比例 {"分组.指标名": 比例}，用于抖动较大的指标
+    """
+    tolerances = tolerances or {}
+    failures = []
+    for group, metrics in results.items():
+        group_baselines = baselines.get(group, {})
+        for name, value in metrics.items():
+            baseline = group_baselines.get(name)
+            metric_tolerance = tolerances.get(f'{group}.{name}', tolerance)
+            if baseline is not None and value > baseline * (1 + metric_tolerance):
+                failures.append(f"{group}.{name}: {value} 超出基线 {baseline} 的 {metric_tolerance:.0%} 容差")
+    return failures
+
+def load_baselines():
+    """读取基线文件"""
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description='热点路径微基准测试')
+    parser.add_argument('--only', help=f"逗号分隔的分组（{','.join(GROUPS)}），默认全部")
+    parser.add_argument('--history-sizes', help='逗号分隔的历史记录条数，默认 1000,10000,100000,1000000')
+    parser.add_argument('--check', action='store_true', help='超出基线容差时返回非零退出码')
+    parser.add_argument('--tolerance', type=float, help='允许超出基线的比例，默认读取基线文件中的tolerance')
+    parser.add_argument('--update', action='store_true', help='用多次运行的中位数更新基线文件（startup预算除外）')
+    parser.add_argument('--runs', type=int,
+                        help=f'运行次数，每个指标取中位数；默认检查时{CHECK_RUNS}次、更新基线时{UPDATE_RUNS}次')
+    args = parser.parse_args()
+
+    groups = [group.strip() for group in args.only.split(',')] if args.only else list(GROUPS)
+    unknown = [group for group in groups if group not in GROUPS]
+    if unknown:
+        parser.error(f"未知的分组: {', '.join(unknown)}")
+    history_sizes = [int(size) for size in args.history_sizes.split(',')] if args.history_sizes else HISTORY_SIZES
+
+    runs = args.runs or (UPDATE_RUNS if args.update else CHECK_RUNS)
+    results = run_median(groups, runs, history_sizes)
+    for group, metrics in results.items():
+        print(f"[{group}]")
+        for name, value in metrics.items():
+            print(f"  {name}: {value}")
+
+    baselines = load_baselines()
+    if args.update:
+        for group, metrics in results.items():
+            # startup中是手工设定的预算，startup.py --check 直接与其比较，不随测量结果更新
+            if group != 'startup':
+                baselines.setdefault(group, {}).update(metrics)
+        baselines.setdefault('tolerance', DEFAULT_TOLERANCE)
+        baselines.setdefault('tolerances', {})
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=4)
+            f.write('\n')
+        print(f"基线已更新: {BASELINE_FILE}")
+        return 0
+
+    if not args.check:
+        return 0
+    tolerance = args.tolerance if args.tolerance is not None else baselines.get('tolerance', DEFAULT_TOLERANCE)
+    # 命令行指定容差时覆盖全部指标的容差
+    tolerances = {} if args.tolerance is not None else baselines.get('tolerances', {})
+    failures = check(results, baselines, tolerance, tolerances)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
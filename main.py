@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import os
+import json
 import time
 import random
+import argparse
 from datetime import datetime
 
 # 导入自定义模块
@@ -9,10 +11,42 @@ from modules.logger import logger
 from modules.config_manager import config_manager
 from modules.account_manager import account_manager
 from modules.history_manager import history_manager
-from modules.signer import DzSigner
+from modules.profiler import profiler, peak_rss_mb
+from modules.failure_cache import failure_cache
+from modules.scheduler import account_scheduler
+from modules.planner import run_planner
 
-def run_multi_sign():
-    """执行多账号签到"""
+# 回放时重定向到临时目录的状态文件：回放不读取本机的Cookie和隔离状态，也不把结果写入真实的签到历史
+REPLAY_SCRATCH_PATHS = {
+    "cookies_dir": "cookies",
+    "history_file": "sign_history.json",
+    "history_dir": "history",
+    "failure_cache_file": "failure_cache.json",
+    "captcha_telemetry_file": "captcha_telemetry.jsonl",
+    "events_dir": "events"
+}
+
+def use_scratch_paths():
+    """把签到状态文件重定向到临时目录，返回该目录"""
+    import tempfile
+    scratch_dir = tempfile.mkdtemp(prefix='mt_replay_')
+    for key, name in REPLAY_SCRATCH_PATHS.items():
+        config_manager.override('paths', key, os.path.join(scratch_dir, name))
+    logger.info(f"回放模式下的签到历史、失败缓存和Cookie写入临时目录: {scratch_dir}")
+    return scratch_dir
+
+def run_multi_sign(workers=1, concurrency=1):
+    """执行多账号签到
+    
+    Args:
+        workers: 工作进程数
+        concurrency: 每个工作进程内的并发签到数，workers和concurrency都为1时逐个顺序签到
+    """
+    # 签到模块依赖requests等较重的库，仅在真正执行签到时导入
+    from modules.runner import sign_account, run_parallel
+    from modules.http_recorder import http_recorder
+    from modules.deadline import Deadline
+    
     # 加载账号信息
     accounts = account_manager.get_accounts()
     if not accounts:
@@ -28,54 +62,90 @@ def run_multi_sign():
     error_delay_min = config_manager.get('sign', 'error_delay', {}).get('min', 10)
     error_delay_max = config_manager.get('sign', 'error_delay', {}).get('max', 15)
     
+    # 单账号时间预算和整次运行的截止时间（秒，0表示不限制）
+    account_timeout = config_manager.get('sign', 'account_timeout', 300)
+    run_deadline = Deadline(config_manager.get('sign', 'run_timeout', 0))
+    
     success_count = 0
     fail_count = 0
+    timeout_count = 0
+    skipped_count = 0
     total_rewards = 0
     start_time = time.time()
     
-    # 循环执行每个账号的签到
-    for i, account in enumerate(accounts):
-        try:
-            username = account.get('username')
-            password = account.get('password')
-            questionid = account.get('questionid', 0)  # 获取安全提问ID，默认为0
-            answer = account.get('answer', "")  # 获取安全提问答案，默认为空
-            
-            if not username or not password:
-                logger.error(f"账号信息不完整，跳过: {account}")
-                fail_count += 1
-                continue
-                
-            logger.info(f"正在处理第 {i+1}/{len(accounts)} 个账号: {username}")
-            
-            # 创建签到实例并执行
-            signer = DzSigner(username, password, questionid, answer)
-            result = signer.run()
-            
-            success_count += 1 if result else fail_count + 1
-            
-            # 获取账号历史记录，提取积分奖励
-            account_history = history_manager.get_account_history(username)
-            if result and account_history and account_history['history']:
-                latest_record = account_history['history'][-1]
-                total_rewards += latest_record.get('reward', 0)
-            
-            # 非最后一个账号需要添加随机延迟
-            if i < len(accounts) - 1:
-                delay = random.uniform(account_delay_min, account_delay_max)
-                logger.info(f"等待 {delay:.2f} 秒后处理下一个账号...")
-                time.sleep(delay)
-                
-        except Exception as e:
-            account_username = account['username'] if isinstance(account, dict) and 'username' in account else '未知'
-            logger.error(f"处理账号 {account_username} 时出现未捕获的异常: {str(e)}")
+    # 过滤信息不完整和处于失败隔离期的账号
+    pending_accounts = []
+    for account in accounts:
+        username = account.get('username') if isinstance(account, dict) else None
+        if not username or not account.get('password'):
+            logger.error(f"账号信息不完整，跳过: {account}")
             fail_count += 1
+            continue
+        
+        # 处于失败隔离期的账号直接跳过，避免浪费验证码识别次数；回放时按磁带中的账号签到
+        skip, entry = (False, None) if http_recorder.is_replay else failure_cache.should_skip(account)
+        if skip:
+            logger.warning(f"账号 {username} 因持续失败({entry['reason']})被隔离至 {entry['retry_after']}，本次跳过")
+            skipped_count += 1
+            continue
+        pending_accounts.append(account)
+    
+    # 按连续签到天数、失败率和登录成本排序，运行时间不足时优先完成价值最高的签到；
+    # 录制时保持配置中的账号顺序，回放时按录制的顺序签到，请求才能与磁带一一对应
+    if http_recorder.is_replay:
+        pending_accounts = http_recorder.order_accounts(pending_accounts)
+    elif http_recorder.mode == 'live':
+        pending_accounts = account_scheduler.order(pending_accounts)
+    
+    parallel = workers > 1 or concurrency > 1
+    if parallel and (http_recorder.mode != 'live' or profiler.enabled):
+        logger.warning("HTTP录制/回放和性能分析仅支持顺序签到，已忽略并发设置")
+        parallel = False
+    
+    # 按历史耗时预测本次运行时间，运行结束后与实际耗时对比
+    try:
+        forecast = run_planner.forecast([account['username'] for account in pending_accounts],
+                                        workers * concurrency if parallel else 1)
+    except Exception as e:
+        logger.warning(f"预测运行耗时失败: {str(e)}")
+        forecast = None
+    
+    if parallel:
+        results = run_parallel(pending_accounts, workers, concurrency, account_timeout, run_deadline)
+    else:
+        results = []
+        # 循环执行每个账号的签到
+        for i, account in enumerate(pending_accounts):
+            logger.info(f"正在处理第 {i+1}/{len(pending_accounts)} 个账号: {account['username']}")
+            
+            # 账号预算不超过运行剩余时间
+            result = sign_account(account, Deadline(account_timeout, parent=run_deadline))
+            results.append(result)
             
-            # 非最后一个账号出现异常时添加额外延迟
-            if i < len(accounts) - 1:
-                delay = random.uniform(error_delay_min, error_delay_max)
-                logger.info(f"出现异常，等待 {delay:.2f} 秒后继续...")
-                time.sleep(delay)
+            # 非最后一个账号需要添加随机延迟，出现异常时延迟更长；回放模式下无需等待
+            if i < len(pending_accounts) - 1 and not http_recorder.is_replay and not run_deadline.expired():
+                if result['status'] == 'error':
+                    delay = random.uniform(error_delay_min, error_delay_max)
+                    logger.info(f"出现异常，等待 {delay:.2f} 秒后继续...")
+                else:
+                    delay = random.uniform(account_delay_min, account_delay_max)
+                    logger.info(f"等待 {delay:.2f} 秒后处理下一个账号...")
+                time.sleep(run_deadline.cap(delay))
+    
+    # 汇总结果，失败缓存只在主进程中更新
+    accounts_by_name = {account['username']: account for account in pending_accounts}
+    for result in results:
+        if result['status'] == 'success':
+            success_count += 1
+            total_rewards += result['reward']
+            failure_cache.clear(result['username'])
+            continue
+        
+        fail_count += 1
+        if result['status'] == 'timeout':
+            timeout_count += 1
+        if result['failure_reason']:
+            failure_cache.record_failure(accounts_by_name[result['username']], result['failure_reason'])
     
     # 计算总耗时
     total_time = time.time() - start_time
@@ -85,20 +155,185 @@ def run_multi_sign():
     logger.info(f"总账号数: {len(accounts)}")
     logger.info(f"成功签到: {success_count}")
     logger.info(f"签到失败: {fail_count}")
+    logger.info(f"超时账号: {timeout_count}")
+    logger.info(f"隔离跳过: {skipped_count}")
     logger.info(f"总积分奖励: {total_rewards}")
     logger.info(f"总耗时: {total_time:.2f}秒")
+    peak_rss = peak_rss_mb()
+    workers_peak_rss = peak_rss_mb(children=True) if parallel and workers > 1 else None
+    if peak_rss is not None:
+        logger.info(f"峰值内存: {peak_rss:.1f} MiB" + (f"（工作进程峰值: {workers_peak_rss:.1f} MiB）" if workers_peak_rss else ""))
     
     # 添加每日汇总到历史记录
     summary_data = {
         "total_accounts": len(accounts),
         "success_count": success_count,
         "fail_count": fail_count,
+        "timeout_count": timeout_count,
+        "skipped_count": skipped_count,
         "total_rewards": total_rewards,
-        "execution_time": round(total_time, 2)
+        "execution_time": round(total_time, 2),
+        "peak_rss_mb": peak_rss
     }
+    if workers_peak_rss:
+        summary_data["workers_peak_rss_mb"] = workers_peak_rss
+    if forecast and pending_accounts:
+        summary_data.update(run_planner.report(forecast, total_time))
     history_manager.add_daily_summary(summary_data)
     
     return success_count > 0  # 返回是否至少有一个账号签到成功
 
+def print_captcha_stats(days):
+    """输出各验证码预处理方案的识别率"""
+    from modules.captcha_telemetry import captcha_telemetry
+    summary = captcha_telemetry.summarize(days)
+    if not summary:
+        print(f"最近{days}天没有验证码识别记录")
+        return True
+    print(f"最近{days}天验证码识别统计:")
+    print(f"{'预处理方案':<12}{'尝试次数':>8}{'被接受':>8}{'准确率':>8}{'登录次数':>8}{'首次通过率':>10}")
+    for profile, stats in sorted(summary.items()):
+        print(f"{profile:<12}{stats['attempts']:>8}{stats['accepted']:>8}{stats['accuracy']:>8.1%}"
+              f"{stats['logins']:>8}{stats['first_try_rate']:>10.1%}")
+    return True
+
+def print_events(days, group_by=None, **filters):
+    """按条件查询事件日志，指定group_by时输出分组统计，否则逐条输出事件"""
+    from modules.event_log import event_log, EVENT_FIELDS
+    events = event_log.iter_events(days, **filters)
+    if not group_by:
+        count = 0
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False))
+            count += 1
+        print(f"共 {count} 条事件")
+        return True
+
+    fields = [field.strip() for field in group_by.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in EVENT_FIELDS]
+    if unknown:
+        print(f"不支持的分组字段: {', '.join(unknown)}，可选: {', '.join(EVENT_FIELDS)}")
+        return False
+    groups = event_log.aggregate(events, fields)
+    if not groups:
+        print(f"最近{days}天没有符合条件的事件")
+        return True
+    print(f"{' / '.join(fields):<40}{'次数':>8}{'平均耗时(ms)':>14}{'最大耗时(ms)':>14}")
+    for key, stats in sorted(groups.items(), key=lambda item: -item[1]['count']):
+        avg_latency = '-' if stats['avg_latency_ms'] is None else f"{stats['avg_latency_ms']:.1f}"
+        print(f"{' / '.join(key):<40}{stats['count']:>8}{avg_latency:>14}{stats['max_latency_ms']:>14.1f}")
+    return True
+
+def print_plan(args):
+    """根据历史耗时估算运行时间，推荐并发数和开始时间"""
+    accounts = [account for account in account_manager.get_accounts()
+                if isinstance(account, dict) and account.get('username')]
+    if not accounts:
+        print("没有可用的账号信息")
+        return False
+    usernames = [account['username'] for account in account_scheduler.order(accounts)]
+    result = run_planner.plan(usernames, concurrency=args.concurrency, rate=args.rate,
+                              target_minutes=args.target, finish_by=args.finish_by, days=args.plan)
+
+    print(f"账号数: {result['accounts']}（其中 {result['with_history']} 个有历史耗时数据）")
+    print(f"并发数: {result['concurrency']}")
+    if 'target' in result:
+        print(f"目标耗时: {result['target'] / 60:.1f} 分钟")
+    if args.rate:
+        print(f"限速: 每秒最多开始 {args.rate} 个账号")
+    print(f"预计耗时: 中位数 {result['p50'] / 60:.1f} 分钟，90分位 {result['p90'] / 60:.1f} 分钟")
+    if 'met' in result and not result['met']:
+        print(f"在并发数上限 {result['max_concurrency']}（parallel.workers×parallel.concurrency）内无法达到目标时间，"
+              "以上为该并发数下的估算")
+    if 'start_at' in result:
+        print(f"建议开始时间: {result['start_at']}（按90分位耗时在 {args.finish_by} 前完成）")
+
+    # 最近几次运行的预测与实际耗时
+    summaries = history_manager.history_data["summary"]
+    recent = [(date, summary) for date, summary in sorted(summaries.items()) if 'forecast_p50' in summary][-5:]
+    if recent:
+        print("最近运行的预测与实际耗时:")
+        for date, summary in recent:
+            print(f"  {date}: 预测 {summary['forecast_p50']:.0f}秒，实际 {summary['execution_time']:.0f}秒")
+    return True
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description='MT论坛多账号自动签到')
+    http_group = parser.add_mutually_exclusive_group()
+    http_group.add_argument('--record', metavar='CASSETTE', help='录制本次运行的全部HTTP交互到磁带文件')
+    http_group.add_argument('--replay', metavar='CASSETTE', help='从磁带文件回放HTTP交互，不访问论坛')
+    parser.add_argument('--replay-timing', action='store_true', help='回放时按录制的耗时等待')
+    parser.add_argument('--profile', nargs='?', const='profiles', metavar='DIR',
+                        help='按签到阶段采集cProfile数据，输出pstats和折叠栈文件（默认目录: profiles）')
+    parser.add_argument('--profile-memory', action='store_true', help='配合--profile，在每个账号前后采集tracemalloc快照')
+    parser.add_argument('--captcha-stats', nargs='?', type=int, const=30, metavar='DAYS',
+                        help='输出最近DAYS天(默认30)各验证码预处理方案的识别率后退出')
+    parser.add_argument('--events', nargs='?', type=int, const=1, metavar='DAYS',
+                        help='查询最近DAYS天(默认1，即今天)的结构化事件日志后退出')
+    parser.add_argument('--account', help='配合--events，按账号过滤')
+    parser.add_argument('--phase', help='配合--events，按阶段过滤（login/captcha/sign/get_stats/run）')
+    parser.add_argument('--status', help='配合--events，按状态过滤')
+    parser.add_argument('--error', help='配合--events，按错误类型过滤（如Timeout、credential）')
+    parser.add_argument('--group-by', metavar='FIELDS',
+                        help='配合--events，按逗号分隔的字段(account,phase,status,error)分组统计')
+    parser.add_argument('--ocr-broker', nargs='?', const='', metavar='ADDRESS',
+                        help='启动本机共享的OCR代理服务（默认地址读取配置api.ocr.broker.address），不执行签到')
+    parser.add_argument('--plan', nargs='?', type=int, const=30, metavar='DAYS',
+                        help='按最近DAYS天(默认30)的签到耗时估算运行时间并推荐并发数后退出')
+    parser.add_argument('--target', type=float, metavar='MINUTES', help='配合--plan，目标运行时长（分钟）')
+    parser.add_argument('--finish-by', metavar='HH:MM', help='配合--plan，目标完成时间，输出建议的开始时间')
+    parser.add_argument('--rate', type=float, help='配合--plan，每秒最多开始签到的账号数')
+    parser.add_argument('--workers', type=int, help='工作进程数（默认读取配置parallel.workers）')
+    parser.add_argument('--concurrency', type=int, help='每个工作进程内的并发签到数（默认读取配置parallel.concurrency）；配合--plan时为总并发数')
+    args = parser.parse_args()
+    if args.finish_by:
+        try:
+            datetime.strptime(args.finish_by, '%H:%M')
+        except ValueError:
+            parser.error(f"--finish-by 需要HH:MM格式的时间，如 08:00: {args.finish_by}")
+    return args
+
+def main():
+    """程序入口"""
+    args = parse_args()
+    if args.captcha_stats is not None:
+        return print_captcha_stats(args.captcha_stats)
+    if args.ocr_broker is not None:
+        from modules.ocr_broker import OCRBroker
+        OCRBroker(args.ocr_broker or None).serve_forever()
+        return True
+    if args.plan is not None:
+        return print_plan(args)
+    if args.events is not None:
+        return print_events(args.events, args.group_by, account=args.account, phase=args.phase,
+                            status=args.status, error=args.error)
+    
+    from modules.http_recorder import http_recorder
+    scratch_dir = None
+    if args.record:
+        http_recorder.configure('record', args.record)
+    elif args.replay:
+        http_recorder.configure('replay', args.replay, replay_timing=args.replay_timing)
+        scratch_dir = use_scratch_paths()
+    if args.profile:
+        profiler.enable(args.profile, memory=args.profile_memory)
+
+    workers = args.workers or config_manager.get('parallel', 'workers', 1)
+    concurrency = args.concurrency or config_manager.get('parallel', 'concurrency', 1)
+
+    profiler.start_run()
+    try:
+        return run_multi_sign(workers, concurrency)
+    finally:
+        profiler.finish_run()
+        http_recorder.save()
+        if scratch_dir:
+            import shutil
+            from modules.event_log import event_log
+            # 先写出缓冲的事件，避免退出时重新创建临时目录
+            event_log.flush()
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
 if __name__ == '__main__':
-    run_multi_sign()
+    main()
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
-import json
 from .logger import logger
 from .config_manager import config_manager
+from .serializer import read_json, write_json
 
 class AccountManager:
     """账户管理类，负责加载和管理账户信息"""
@@ -21,10 +21,13 @@ class AccountManager:
         if self._initialized:
             return
             
-        # 获取账户配置文件路径
-        self.account_file = config_manager.get('paths', 'accounts_file', 'accounts.json')
         self._initialized = True
-        self._accounts = self.load_accounts()
+        # 账号文件在首次获取账号时才加载
+    
+    @property
+    def account_file(self):
+        """账户配置文件路径"""
+        return config_manager.get('paths', 'accounts_file', 'accounts.json')
     
     def load_accounts(self):
         """从配置文件加载账号信息"""
@@ -35,14 +38,12 @@ class AccountManager:
                     {"username": "用户名1", "password": "密码1", "questionid": 0, "answer": ""},
                     {"username": "用户名2", "password": "密码2", "questionid": 1, "answer": "安全问题答案"}
                 ]
-                with open(self.account_file, 'w', encoding='utf-8') as f:
-                    json.dump(example_accounts, f, ensure_ascii=False, indent=4)
+                write_json(self.account_file, example_accounts, pretty=True)
                 logger.warning(f"账号配置文件不存在，已创建示例配置文件: {self.account_file}")
                 logger.warning(f"请修改配置文件后重新运行程序")
                 return []
                 
-            with open(self.account_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = read_json(self.account_file)
                 
             # 直接使用加载的数据作为账号列表
             if not isinstance(data, list):
@@ -61,6 +62,8 @@ class AccountManager:
     
     def get_accounts(self):
         """获取所有账号信息"""
+        if self._accounts is None:
+            self._accounts = self.load_accounts()
         return self._accounts
     
     def reload_accounts(self):
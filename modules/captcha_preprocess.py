@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import io
+
+# 预处理方案：按顺序执行的步骤列表
+DEFAULT_PROFILES = {
+    "none": [],
+    "default": ["grayscale", "binarize", "denoise", "resize"],
+    "clean": ["grayscale", "binarize", "remove_lines", "denoise", "resize"]
+}
+# 步骤参数默认值
+DEFAULT_OPTIONS = {
+    "threshold": 140,  # 二值化阈值，低于该灰度的像素视为字符
+    "scale": 2,        # 放大倍数
+    "median_size": 3   # 中值滤波窗口
+}
+
+def _grayscale(image, options):
+    """转为灰度图"""
+    return image.convert('L')
+
+def _binarize(image, options):
+    """按阈值二值化，字符为黑色、背景为白色"""
+    threshold = options['threshold']
+    return image.convert('L').point(lambda value: 0 if value < threshold else 255, 'L')
+
+def _denoise(image, options):
+    """中值滤波去除孤立噪点"""
+    from PIL import ImageFilter
+    return image.filter(ImageFilter.MedianFilter(options['median_size']))
+
+def _remove_lines(image, options):
+    """去除单像素宽的干扰线
+
+    字符笔画通常至少两个像素宽，上下都是背景的黑色像素视为水平干扰线，
+    左右都是背景的黑色像素视为垂直干扰线。
+    """
+    image = image.convert('L')
+    width, height = image.size
+    source = image.load()
+    result = image.copy()
+    pixels = result.load()
+    for y in range(1, height - 1):
+        for x in range(1, width - 1):
+            if source[x, y] != 0:
+                continue
+            thin_horizontal = source[x, y - 1] == 255 and source[x, y + 1] == 255
+            thin_vertical = source[x - 1, y] == 255 and source[x + 1, y] == 255
+            if thin_horizontal or thin_vertical:
+                pixels[x, y] = 255
+    return result
+
+def _resize(image, options):
+    """放大图片，小尺寸验证码放大后识别率更高"""
+    from PIL import Image
+    scale = options['scale']
+    return image.resize((image.width * scale, image.height * scale), Image.LANCZOS)
+
+STEPS = {
+    "grayscale": _grayscale,
+    "binarize": _binarize,
+    "denoise": _denoise,
+    "remove_lines": _remove_lines,
+    "resize": _resize
+}
+
+def preprocess(image_bytes, steps, options=None):
+    """按步骤预处理验证码图片
+
+    Args:
+        image_bytes: 原始图片数据
+        steps: 步骤名称列表，为空时原样返回
+        options: 步骤参数，未指定的使用默认值
+
+    Returns:
+        bytes: 处理后的PNG图片数据
+    """
+    if not steps:
+        return image_bytes
+    from PIL import Image
+
+    merged = dict(DEFAULT_OPTIONS)
+    merged.update(options or {})
+    image = Image.open(io.BytesIO(image_bytes))
+    # GIF等调色板图片先转为RGB
+    if image.mode not in ('L', 'RGB'):
+        image = image.convert('RGB')
+    for step in steps:
+        if step not in STEPS:
+            raise ValueError(f"未知的验证码预处理步骤: {step}")
+        image = STEPS[step](image, merged)
+
+    output = io.BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+from datetime import datetime, timedelta
+from .logger import logger
+from .config_manager import config_manager
+from .serializer import dumps_line, loads
+
+class CaptchaTelemetry:
+    """验证码识别遥测，记录每次识别尝试的结果并按预处理方案统计准确率"""
+    _instance = None  # 单例模式实例
+
+    def __new__(cls):
+        """实现单例模式"""
+        if cls._instance is None:
+            cls._instance = super(CaptchaTelemetry, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化验证码遥测"""
+        if self._initialized:
+            return
+
+        self._lock = threading.Lock()
+        self._initialized = True
+
+    @property
+    def telemetry_file(self):
+        """遥测文件路径，默认放在日志目录中"""
+        logs_dir = config_manager.get('paths', 'logs_dir', 'logs')
+        return config_manager.get('paths', 'captcha_telemetry_file', os.path.join(logs_dir, 'captcha_telemetry.jsonl'))
+
+    def record(self, username, attempt, outcome, recognition=None):
+        """记录一次验证码尝试
+
+        Args:
+            username: 账号
+            attempt: 本次登录中的第几次验证码尝试，从1开始
+            outcome: accepted（论坛接受）/ rejected（验证码错误）/ unrecognized（未识别出结果）
+            recognition: OCRManager.recognize 返回的识别信息
+        """
+        recognition = recognition or {}
+        event = {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "username": username,
+            "attempt": attempt,
+            "outcome": outcome,
+            "profile": recognition.get('profile'),
+            "backend": recognition.get('backend'),
+            "confidence": recognition.get('confidence'),
+            "length": len(recognition.get('text') or '')
+        }
+        try:
+            directory = os.path.dirname(self.telemetry_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._lock:
+                with open(self.telemetry_file, 'a', encoding='utf-8') as f:
+                    f.write(dumps_line(event) + '\n')
+            return True
+        except Exception as e:
+            logger.error(f"记录验证码遥测失败: {str(e)}")
+            return False
+
+    def summarize(self, days=30):
+        """按预处理方案统计识别效果
+
+        Returns:
+            dict: {方案: {attempts, accepted, logins, first_try, first_try_rate, accuracy}}
+        """
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        summary = {}
+        if not os.path.exists(self.telemetry_file):
+            return summary
+
+        with open(self.telemetry_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    event = loads(line)
+                except ValueError:
+                    continue
+                if event.get('time', '') < since:
+                    continue
+                stats = summary.setdefault(event.get('profile') or 'none', {
+                    "attempts": 0, "accepted": 0, "logins": 0, "first_try": 0
+                })
+                stats['attempts'] += 1
+                if event.get('outcome') == 'accepted':
+                    stats['accepted'] += 1
+                # 每次登录的第一次尝试作为一次登录的开始
+                if event.get('attempt') == 1:
+                    stats['logins'] += 1
+                    if event.get('outcome') == 'accepted':
+                        stats['first_try'] += 1
+
+        for stats in summary.values():
+            stats['first_try_rate'] = round(stats['first_try'] / stats['logins'], 4) if stats['logins'] else 0
+            stats['accuracy'] = round(stats['accepted'] / stats['attempts'], 4) if stats['attempts'] else 0
+        return summary
+
+# 创建全局验证码遥测实例
+captcha_telemetry = CaptchaTelemetry()
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
-import json
 import logging
+from .serializer import read_json, write_json
 
 class ConfigManager:
     """配置管理类，负责加载和管理配置信息"""
@@ -22,8 +22,15 @@ class ConfigManager:
             
         self.logger = logging.getLogger('mt_sign')
         self.config_file = 'config.json'
+        # 只在本进程内生效的临时配置，不会写入配置文件
+        self._overrides = {}
         self._initialized = True
-        self._load_config()
+        # 配置文件在首次访问时才加载，避免导入模块时读写文件
+    
+    def _ensure_loaded(self):
+        """确保配置已加载"""
+        if self._config is None:
+            self._load_config()
     
     def _load_config(self):
         """加载配置文件"""
@@ -33,13 +40,37 @@ class ConfigManager:
                 "baidu_ocr": {
                     "api_key": "你的百度OCR API Key",
                     "secret_key": "你的百度OCR Secret Key"
+                },
+                "ocr": {
+                    "backends": ["accurate_basic"],
+                    "min_confidence": 0.85,
+                    "captcha_length": 4,
+                    "alphabet": "BCEFGHJKMPQRTVWXY2346789",
+                    "preprocess": {
+                        "profile": "default",
+                        "options": {
+                            "threshold": 140,
+                            "scale": 2
+                        }
+                    },
+                    "broker": {
+                        "enabled": False,
+                        "address": "127.0.0.1:8765",
+                        "qps": 2,
+                        "max_queue": 100,
+                        "pool_size": 4,
+                        "timeout": 60,
+                        "fallback": True
+                    }
                 }
             },
             "request": {
-                "timeout": 30,
+                "connect_timeout": 10,
+                "read_timeout": 30,
                 "max_retries": 3,
                 "retry_delay": 3,
-                "captcha_max_attempts": 3
+                "captcha_max_attempts": 3,
+                "max_response_bytes": 2097152
             },
             "paths": {
                 "accounts_file": "accounts.json",
@@ -55,6 +86,56 @@ class ConfigManager:
                 "error_delay": {
                     "min": 10,
                     "max": 15
+                },
+                "confirm_backoff": {
+                    "initial": 0.3,
+                    "max_attempts": 3
+                },
+                "account_timeout": 300,
+                "run_timeout": 0
+            },
+            "parallel": {
+                "workers": 1,
+                "concurrency": 1
+            },
+            "events": {
+                "enabled": True,
+                "buffer_size": 50
+            },
+            "history": {
+                "active_months": 2
+            },
+            "storage": {
+                "pretty": False
+            },
+            "scheduler": {
+                "strategy": "priority",
+                "cookie_cost": 1,
+                "login_cost": 4,
+                "cookie_max_age_days": 30,
+                "failure_window_days": 30
+            },
+            "tasks": {
+                "task_reward": {
+                    "enabled": False,
+                    "apply_new": True
+                },
+                "credit": {
+                    "enabled": False
+                }
+            },
+            "failure_cache": {
+                "credential": {
+                    "base_hours": 24,
+                    "max_hours": 720
+                },
+                "locked": {
+                    "base_hours": 1,
+                    "max_hours": 24
+                },
+                "captcha": {
+                    "base_hours": 1,
+                    "max_hours": 12
                 }
             }
         }
@@ -62,14 +143,12 @@ class ConfigManager:
         try:
             # 如果配置文件不存在，创建默认配置文件
             if not os.path.exists(self.config_file):
-                with open(self.config_file, 'w', encoding='utf-8') as f:
-                    json.dump(default_config, f, ensure_ascii=False, indent=4)
+                write_json(self.config_file, default_config, pretty=True)
                 self._config = default_config
                 return
                 
             # 读取现有配置文件
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                self._config = json.load(f)
+            self._config = read_json(self.config_file)
                 
         except Exception as e:
             self.logger.error(f"加载配置文件失败: {str(e)}，将使用默认配置")
@@ -77,6 +156,7 @@ class ConfigManager:
     
     def get_config(self):
         """获取完整配置"""
+        self._ensure_loaded()
         return self._config
     
     def get(self, section, key=None, default=None):
@@ -90,6 +170,9 @@ class ConfigManager:
         Returns:
             配置值或默认值
         """
+        self._ensure_loaded()
+        if key is not None and (section, key) in self._overrides:
+            return self._overrides[(section, key)]
         try:
             if section not in self._config:
                 return default
@@ -105,6 +188,16 @@ class ConfigManager:
             self.logger.error(f"获取配置项失败: {str(e)}")
             return default
     
+    def override(self, section, key, value):
+        """临时覆盖配置项，只在本进程内生效，不会写入配置文件
+
+        Args:
+            section: 配置节名称
+            key: 配置项名称
+            value: 覆盖后的值
+        """
+        self._overrides[(section, key)] = value
+    
     def save_config(self, config=None):
         """保存配置到文件
         
@@ -117,9 +210,10 @@ class ConfigManager:
         try:
             if config is not None:
                 self._config = config
+            else:
+                self._ensure_loaded()
                 
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(self._config, f, ensure_ascii=False, indent=4)
+            write_json(self.config_file, self._config, pretty=True)
             return True
         except Exception as e:
             self.logger.error(f"保存配置文件失败: {str(e)}")
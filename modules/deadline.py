@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+class DeadlineExceeded(Exception):
+    """超出时间预算时抛出的异常"""
+    pass
+
+class Deadline:
+    """墙钟时间预算，可嵌套在上级预算（如整次运行的截止时间）之下"""
+    def __init__(self, seconds=None, parent=None):
+        """初始化时间预算
+
+        Args:
+            seconds: 预算秒数，None或0表示不限制
+            parent: 上级时间预算，剩余时间取两者中较小值
+        """
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.parent = parent
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        """剩余秒数，不限制时返回None"""
+        candidates = []
+        if self.expires_at is not None:
+            candidates.append(self.expires_at - time.monotonic())
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                candidates.append(parent_remaining)
+        if not candidates:
+            return None
+        return max(0.0, min(candidates))
+
+    def expired(self):
+        """是否已超时或被取消"""
+        if self._cancelled.is_set():
+            return True
+        if self.parent is not None and self.parent.expired():
+            return True
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def cancel(self):
+        """主动取消，后续检查都会抛出超时异常"""
+        self._cancelled.set()
+
+    def check(self):
+        """已超时则抛出DeadlineExceeded"""
+        if self.expired():
+            raise DeadlineExceeded("已超出时间预算")
+
+    def cap(self, seconds):
+        """把等待或超时时间限制在剩余预算内"""
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return min(seconds, remaining)
+
+    def sleep(self, seconds):
+        """在预算内等待，等待结束后已超时则抛出异常"""
+        self.check()
+        self._cancelled.wait(self.cap(seconds))
+        self.check()
+
+class Watchdog:
+    """看门狗，时间预算到期时在后台线程中执行取消回调"""
+    def __init__(self, deadline, on_expire=None):
+        self.deadline = deadline
+        self.on_expire = on_expire
+        self._timer = None
+
+    def _fire(self):
+        self.deadline.cancel()
+        if self.on_expire:
+            self.on_expire()
+
+    def start(self):
+        """启动看门狗，预算不限制时不启动"""
+        remaining = self.deadline.remaining()
+        if remaining is None:
+            return self
+        self._timer = threading.Timer(remaining, self._fire)
+        self._timer.daemon = True
+        self._timer.start()
+        return self
+
+    def stop(self):
+        """停止看门狗"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
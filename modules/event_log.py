@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from .logger import logger
+from .config_manager import config_manager
+from .serializer import dumps_line, loads
+
+# 可用于过滤和分组的事件字段
+EVENT_FIELDS = ('account', 'phase', 'status', 'error')
+
+class EventLog:
+    """结构化事件日志，按天写入JSON Lines文件
+
+    每条事件包含账号、阶段、尝试次数、状态、耗时和错误类型，与文本日志并行记录。
+    事件先写入内存缓冲区，达到缓冲条数或程序退出时批量追加到文件，
+    每次追加是一次write调用，多进程同时写同一天的文件时行不会交错。
+    """
+    _instance = None  # 单例模式实例
+
+    def __new__(cls):
+        """实现单例模式"""
+        if cls._instance is None:
+            cls._instance = super(EventLog, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化事件日志"""
+        if self._initialized:
+            return
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._settings_loaded = False
+        atexit.register(self.flush)
+        self._initialized = True
+
+    def _ensure_settings(self):
+        """首次使用时读取配置"""
+        if self._settings_loaded:
+            return
+        self.enabled = config_manager.get('events', 'enabled', True)
+        self.buffer_size = max(1, config_manager.get('events', 'buffer_size', 50))
+        self._settings_loaded = True
+
+    @property
+    def events_dir(self):
+        """事件文件目录，默认与文本日志放在一起"""
+        logs_dir = config_manager.get('paths', 'logs_dir', 'logs')
+        return config_manager.get('paths', 'events_dir', logs_dir)
+
+    def event_file(self, date):
+        """指定日期(YYYY-MM-DD)的事件文件路径"""
+        return os.path.join(self.events_dir, f'events_{date}.jsonl')
+
+    def emit(self, account, phase, status, latency=None, attempt=None, error=None, **extra):
+        """记录一条事件
+
+        Args:
+            account: 账号
+            phase: 阶段，如 login / captcha / sign / get_stats / run
+            status: 状态，如 success / failed / retry / timeout
+            latency: 耗时（秒）
+            attempt: 该阶段内的第几次尝试，从1开始
+            error: 错误类型，异常类名或失败分类（credential / locked / captcha）
+        """
+        self._ensure_settings()
+        if not self.enabled:
+            return
+        event = {
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "account": account,
+            "phase": phase,
+            "attempt": attempt,
+            "status": status,
+            "latency_ms": None if latency is None else round(latency * 1000, 1),
+            "error": error,
+            "pid": os.getpid()
+        }
+        event.update(extra)
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.buffer_size
+        if full:
+            self.flush()
+
+    @contextmanager
+    def phase(self, account, phase, attempt=None):
+        """记录一个阶段的耗时和结果
+
+        返回的字典可由调用方设置status和error；阶段内抛出异常时记录为exception，
+        错误类型为异常类名。
+        """
+        outcome = {'status': 'success', 'error': None}
+        start = time.perf_counter()
+        try:
+            yield outcome
+        except BaseException as e:
+            outcome.update(status='exception', error=type(e).__name__)
+            raise
+        finally:
+            self.emit(account, phase, outcome['status'], time.perf_counter() - start,
+                      attempt=attempt, error=outcome['error'])
+
+    def flush(self):
+        """把缓冲区中的事件追加到文件"""
+        with self._lock:
+            events, self._buffer = self._buffer, []
+        if not events:
+            return True
+        try:
+            os.makedirs(self.events_dir, exist_ok=True)
+            # 按事件日期分组，跨零点的运行写入各自的文件
+            lines_by_date = {}
+            for event in events:
+                lines_by_date.setdefault(event['time'][:10], []).append(dumps_line(event) + '\n')
+            for date, lines in lines_by_date.items():
+                with open(self.event_file(date), 'a', encoding='utf-8') as f:
+                    f.write(''.join(lines))
+            return True
+        except Exception as e:
+            logger.error(f"写入事件日志失败: {str(e)}")
+            return False
+
+    def iter_events(self, days=1, **filters):
+        """逐行读取最近days天的事件，只在内存中保留当前一行
+
+        Args:
+            days: 天数，1表示只读取今天
+            filters: 字段过滤条件，如 account="user" / phase="login" / error="Timeout"
+
+        Yields:
+            dict: 满足全部过滤条件的事件
+        """
+        filters = {key: value for key, value in filters.items() if value is not None}
+        today = datetime.now().date()
+        for offset in range(days - 1, -1, -1):
+            path = self.event_file((today - timedelta(days=offset)).strftime("%Y-%m-%d"))
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    # 过滤值不出现在该行中时无需解析JSON
+                    if any(str(value) not in line for value in filters.values()):
+                        continue
+                    try:
+                        event = loads(line)
+                    except ValueError:
+                        continue
+                    if all(str(event.get(key)) == str(value) for key, value in filters.items()):
+                        yield event
+
+    def aggregate(self, events, group_by):
+        """按字段分组统计事件数量和平均耗时
+
+        Returns:
+            dict: {分组值: {count, avg_latency_ms, max_latency_ms}}
+        """
+        groups = {}
+        for event in events:
+            key = tuple(str(event.get(field)) for field in group_by)
+            stats = groups.setdefault(key, {"count": 0, "latency_total": 0, "latency_count": 0, "max_latency_ms": 0})
+            stats['count'] += 1
+            latency = event.get('latency_ms')
+            if latency is not None:
+                stats['latency_total'] += latency
+                stats['latency_count'] += 1
+                stats['max_latency_ms'] = max(stats['max_latency_ms'], latency)
+
+        for stats in groups.values():
+            latency_count = stats.pop('latency_count')
+            latency_total = stats.pop('latency_total')
+            stats['avg_latency_ms'] = round(latency_total / latency_count, 1) if latency_count else None
+        return groups
+
+# 创建全局事件日志实例
+event_log = EventLog()
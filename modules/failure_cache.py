@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+from datetime import datetime, timedelta
+from .logger import logger
+from .config_manager import config_manager
+from .serializer import read_json, write_json
+
+# 失败类型及默认退避参数（小时）
+# credential: 密码错误等永久性失败，直到账号配置变化前都按指数退避隔离
+# locked: 密码错误次数过多被临时锁定
+# captcha: 验证码识别次数用尽，属于暂时性失败，较快重试
+DEFAULT_BACKOFF = {
+    "credential": {"base_hours": 24, "max_hours": 720},
+    "locked": {"base_hours": 1, "max_hours": 24},
+    "captcha": {"base_hours": 1, "max_hours": 12}
+}
+
+def account_fingerprint(account):
+    """根据账号的登录凭据计算指纹，凭据变化后隔离自动解除"""
+    raw = '\x00'.join(str(account.get(key, '')) for key in ('username', 'password', 'questionid', 'answer'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class FailureCache:
+    """失败分类缓存，记录持续失败的账号并按退避策略跳过"""
+    _instance = None  # 单例模式实例
+    _cache = None     # 缓存数据
+
+    def __new__(cls):
+        """实现单例模式"""
+        if cls._instance is None:
+            cls._instance = super(FailureCache, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化失败缓存"""
+        if self._initialized:
+            return
+
+        self._initialized = True
+        # 缓存文件在首次访问时才加载
+
+    @property
+    def cache_file(self):
+        """缓存文件路径，默认与历史记录文件放在同一目录"""
+        history_file = config_manager.get('paths', 'history_file', 'sign_history.json')
+        default_file = os.path.join(os.path.dirname(history_file), 'failure_cache.json')
+        return config_manager.get('paths', 'failure_cache_file', default_file)
+
+    @property
+    def cache(self):
+        """缓存数据，首次访问时从文件加载"""
+        if self._cache is None:
+            self._cache = self.load_cache()
+        return self._cache
+
+    def load_cache(self):
+        """加载失败缓存"""
+        try:
+            if not os.path.exists(self.cache_file):
+                return {}
+            return read_json(self.cache_file)
+        except Exception as e:
+            logger.error(f"加载失败缓存失败: {str(e)}")
+            return {}
+
+    def save_cache(self):
+        """保存失败缓存"""
+        try:
+            write_json(self.cache_file, self.cache)
+            return True
+        except Exception as e:
+            logger.error(f"保存失败缓存失败: {str(e)}")
+            return False
+
+    def _backoff_hours(self, reason, failures):
+        """计算第failures次失败后的退避时长"""
+        backoff = dict(DEFAULT_BACKOFF.get(reason, DEFAULT_BACKOFF['captcha']))
+        backoff.update(config_manager.get('failure_cache', reason, {}))
+        return min(backoff['base_hours'] * (2 ** (failures - 1)), backoff['max_hours'])
+
+    def should_skip(self, account):
+        """判断账号当前是否处于隔离期
+
+        Returns:
+            tuple: (是否跳过, 缓存条目)
+        """
+        username = account.get('username')
+        entry = self.cache.get(username)
+        if not entry:
+            return False, None
+
+        # 账号配置已修改，解除隔离
+        if entry.get('fingerprint') != account_fingerprint(account):
+            logger.info(f"[{username}] 账号配置已变化，解除失败隔离")
+            self.clear(username)
+            return False, None
+
+        retry_after = datetime.strptime(entry['retry_after'], "%Y-%m-%d %H:%M:%S")
+        if datetime.now() < retry_after:
+            return True, entry
+        return False, entry
+
+    def record_failure(self, account, reason):
+        """记录一次可分类的失败，并计算下次允许重试的时间"""
+        try:
+            username = account.get('username')
+            fingerprint = account_fingerprint(account)
+            entry = self.cache.get(username)
+            now = datetime.now()
+
+            # 失败类型或凭据变化时重新计数
+            if not entry or entry.get('reason') != reason or entry.get('fingerprint') != fingerprint:
+                entry = {
+                    "reason": reason,
+                    "fingerprint": fingerprint,
+                    "failures": 0,
+                    "first_failed": now.strftime("%Y-%m-%d %H:%M:%S")
+                }
+
+            entry['failures'] += 1
+            entry['last_failed'] = now.strftime("%Y-%m-%d %H:%M:%S")
+            hours = self._backoff_hours(reason, entry['failures'])
+            entry['retry_after'] = (now + timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+            self.cache[username] = entry
+            logger.warning(f"[{username}] 失败类型: {reason}，第{entry['failures']}次，{hours}小时内不再尝试 (至 {entry['retry_after']})")
+            self.save_cache()
+            return True
+        except Exception as e:
+            logger.error(f"记录失败缓存失败: {str(e)}")
+            return False
+
+    def clear(self, username):
+        """签到成功或凭据变化后清除账号的失败记录"""
+        if username in self.cache:
+            del self.cache[username]
+            self.save_cache()
+
+# 创建全局失败缓存实例
+failure_cache = FailureCache()
@@ -1,14 +1,38 @@
 # -*- coding: utf-8 -*-
 import os
-import json
+import threading
 from datetime import datetime
 from .logger import logger
 from .config_manager import config_manager
+from .serializer import read_json, write_json
+
+# 索引文件格式版本，旧版历史文件没有该字段，所有记录都保存在accounts.<用户名>.history中
+HISTORY_VERSION = 2
+# 分区状态：active为普通JSON文件，archived为压缩归档
+PARTITION_ACTIVE = 'active'
+PARTITION_ARCHIVED = 'archived'
+# 分区中保存附加任务记录的键：{TASKS_KEY: {用户名: [任务记录]}}
+TASKS_KEY = '__tasks__'
+
+def _month_of(date):
+    """从YYYY-MM-DD格式的日期中取出分区月份"""
+    return date[:7]
+
+def _month_index(month):
+    """把YYYY-MM转换为便于比较先后的月份序号"""
+    year, month = month.split('-')
+    return int(year) * 12 + int(month) - 1
 
 class HistoryManager:
-    """历史记录管理类，负责管理签到历史记录"""
+    """历史记录管理类，负责管理签到历史记录
+    
+    历史记录分为两部分：
+    - 索引文件（paths.history_file）：各账号的最近签到信息、每日汇总和分区列表，始终加载
+    - 按月分区（paths.history_dir）：{用户名: [签到记录]}，只在查询或写入该月记录时加载，
+      超过history.active_months个月的分区压缩归档到archive目录
+    """
     _instance = None  # 单例模式实例
-    _history_data = None  # 历史数据缓存
+    _history_data = None  # 索引数据缓存
     
     def __new__(cls):
         """实现单例模式"""
@@ -21,59 +45,239 @@ class HistoryManager:
         """初始化历史记录管理器"""
         if self._initialized:
             return
-            
-        # 获取历史记录文件路径
-        self.history_file = config_manager.get('paths', 'history_file', 'sign_history.json')
+        
         self._initialized = True
-        self._history_data = self.load_history()
+        self._lock = threading.RLock()
+        # 收集模式下的待合并记录，None表示直接写入
+        self._collected = None
+        # 已加载的月份分区和有未保存修改的分区
+        self._partitions = {}
+        self._dirty_partitions = set()
+        # 历史记录在首次访问时才加载
+    
+    @property
+    def history_file(self):
+        """历史记录索引文件路径"""
+        return config_manager.get('paths', 'history_file', 'sign_history.json')
+    
+    @property
+    def history_dir(self):
+        """月份分区目录，默认与索引文件放在同一目录"""
+        default_dir = os.path.join(os.path.dirname(self.history_file), 'history')
+        return config_manager.get('paths', 'history_dir', default_dir)
+    
+    @property
+    def history_data(self):
+        """索引数据，首次访问时从文件加载"""
+        if self._history_data is None:
+            self._history_data = self.load_history()
+        return self._history_data
+    
+    def _partition_file(self, month, status=PARTITION_ACTIVE):
+        """月份分区的文件路径"""
+        if status == PARTITION_ARCHIVED:
+            return os.path.join(self.history_dir, 'archive', f'{month}.json.gz')
+        return os.path.join(self.history_dir, f'{month}.json')
     
     def load_history(self):
-        """加载历史记录"""
+        """加载历史记录索引，旧版历史文件会自动迁移为分区格式"""
         try:
             if not os.path.exists(self.history_file):
                 # 如果历史记录文件不存在，创建空记录
                 default_history = {
+                    "version": HISTORY_VERSION,
                     "accounts": {},
-                    "summary": {}
+                    "summary": {},
+                    "partitions": {}
                 }
-                with open(self.history_file, 'w', encoding='utf-8') as f:
-                    json.dump(default_history, f, ensure_ascii=False, indent=4)
+                write_json(self.history_file, default_history)
                 return default_history
-                
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                
+            
+            history = read_json(self.history_file)
+            
+            if history.get('version') != HISTORY_VERSION:
+                history = self._migrate_legacy(history)
             return history
         except Exception as e:
             logger.error(f"加载历史记录失败: {str(e)}")
             # 返回空记录
-            return {"accounts": {}, "summary": {}}
+            return {"version": HISTORY_VERSION, "accounts": {}, "summary": {}, "partitions": {}}
+    
+    def _migrate_legacy(self, legacy):
+        """把旧版单文件历史记录拆分为索引和月份分区，原文件备份为.legacy.bak"""
+        logger.info("检测到旧版历史记录文件，正在迁移为按月分区格式...")
+        index = {
+            "version": HISTORY_VERSION,
+            "accounts": {},
+            "summary": legacy.get("summary", {}),
+            "partitions": {}
+        }
+        partitions = {}
+        for username, account in legacy.get("accounts", {}).items():
+            for record in account.get("history", []):
+                partitions.setdefault(_month_of(record["date"]), {}).setdefault(username, []).append(record)
+            index["accounts"][username] = {
+                "last_sign": account.get("last_sign", ""),
+                "consecutive_days": account.get("consecutive_days", 0),
+                "total_days": account.get("total_days", 0)
+            }
+        
+        for month, data in partitions.items():
+            index["partitions"][month] = PARTITION_ACTIVE
+            self._write_partition(month, data, PARTITION_ACTIVE)
+        
+        self._history_data = index
+        # 迁移后的旧分区按配置压缩归档
+        self._compact_partitions()
+        
+        os.replace(self.history_file, self.history_file + '.legacy.bak')
+        write_json(self.history_file, index)
+        logger.info(f"历史记录迁移完成，共 {len(partitions)} 个月份分区，原文件已备份为 {self.history_file}.legacy.bak")
+        return index
+    
+    def _read_partition(self, month, status):
+        """读取月份分区文件"""
+        path = self._partition_file(month, status)
+        if not os.path.exists(path):
+            return {}
+        return read_json(path)
+    
+    def _write_partition(self, month, data, status):
+        """写入月份分区文件，归档分区使用gzip压缩且不缩进"""
+        path = self._partition_file(month, status)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json(path, data, pretty=False if status == PARTITION_ARCHIVED else None)
+    
+    def _get_partition(self, month, create=False):
+        """获取月份分区，首次访问时才从文件加载
+        
+        Args:
+            month: 分区月份 YYYY-MM
+            create: 分区不存在时是否创建
+        """
+        with self._lock:
+            if month in self._partitions:
+                return self._partitions[month]
+            
+            status = self.history_data["partitions"].get(month)
+            if status is None:
+                if not create:
+                    return None
+                self.history_data["partitions"][month] = PARTITION_ACTIVE
+                self._partitions[month] = {}
+                return self._partitions[month]
+            
+            self._partitions[month] = self._read_partition(month, status)
+            return self._partitions[month]
+    
+    def _compact_partitions(self):
+        """把超过history.active_months个月的分区压缩归档，并从内存中释放"""
+        active_months = config_manager.get('history', 'active_months', 2)
+        current = _month_index(datetime.now().strftime("%Y-%m"))
+        partitions = self.history_data["partitions"]
+        compacted = []
+        for month, status in sorted(partitions.items()):
+            if status != PARTITION_ACTIVE or current - _month_index(month) < active_months:
+                continue
+            data = self._partitions.pop(month, None)
+            if data is None:
+                data = self._read_partition(month, PARTITION_ACTIVE)
+            self._write_partition(month, data, PARTITION_ARCHIVED)
+            partitions[month] = PARTITION_ARCHIVED
+            self._dirty_partitions.discard(month)
+            active_file = self._partition_file(month, PARTITION_ACTIVE)
+            if os.path.exists(active_file):
+                os.remove(active_file)
+            compacted.append(month)
+        
+        if compacted:
+            logger.info(f"已归档历史记录分区: {', '.join(compacted)}")
+        return compacted
     
     def save_history(self):
-        """保存历史记录"""
+        """保存历史记录索引和有修改的分区"""
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self._history_data, f, ensure_ascii=False, indent=4)
+            with self._lock:
+                # 先取出数据再打开文件，避免首次加载时读到被清空的文件
+                history_data = self.history_data
+                for month in sorted(self._dirty_partitions):
+                    self._write_partition(month, self._partitions[month], history_data["partitions"][month])
+                self._dirty_partitions.clear()
+                self._compact_partitions()
+                write_json(self.history_file, history_data)
             return True
         except Exception as e:
             logger.error(f"保存历史记录失败: {str(e)}")
             return False
     
+    def start_collecting(self):
+        """进入收集模式：签到记录只暂存在内存中，由主进程统一合并写入"""
+        with self._lock:
+            self._collected = []
+    
+    def stop_collecting(self):
+        """退出收集模式，返回暂存的记录列表"""
+        with self._lock:
+            collected, self._collected = self._collected or [], None
+            return collected
+    
+    def _account_header(self, username):
+        """获取索引中的账号信息，不存在时创建"""
+        return self.history_data["accounts"].setdefault(username, {
+            "last_sign": "",
+            "consecutive_days": 0,
+            "total_days": 0
+        })
+    
+    def _apply_record(self, username, record):
+        """把一条签到记录或任务记录写入对应的月份分区并更新索引中的账号信息"""
+        month = _month_of(record["date"])
+        partition = self._get_partition(month, create=True)
+        self._dirty_partitions.add(month)
+        
+        if "task" in record:
+            partition.setdefault(TASKS_KEY, {}).setdefault(username, []).append(record)
+            # 索引中只保留每个任务最近一次的结果
+            self._account_header(username).setdefault("tasks", {})[record["task"]] = {
+                "date": record["date"],
+                "status": record["status"]
+            }
+            return
+        
+        partition.setdefault(username, []).append(record)
+        # 更新账号信息：last_sign指向最近一条记录所在的日期（用于定位分区），
+        # 连续签到天数和总天数只由成功的记录更新，失败或超时的记录中没有这些数据
+        account = self._account_header(username)
+        account["last_sign"] = record["date"]
+        if record["status"] == "success":
+            account["last_success"] = record["date"]
+            account["consecutive_days"] = record["consecutive_days"]
+            account["total_days"] = record["total_days"]
+    
+    def merge_records(self, entries):
+        """合并工作进程收集的签到记录，只写入一次文件
+        
+        Args:
+            entries: [(用户名, 签到记录)] 列表
+        """
+        if not entries:
+            return True
+        try:
+            with self._lock:
+                for username, record in entries:
+                    self._apply_record(username, record)
+                self.save_history()
+            return True
+        except Exception as e:
+            logger.error(f"合并签到记录失败: {str(e)}")
+            return False
+    
     def add_sign_record(self, username, sign_data):
         """添加签到记录"""
         try:
             current_date = datetime.now().strftime("%Y-%m-%d")
             current_time = datetime.now().strftime("%H:%M:%S")
             
-            # 确保账号记录存在
-            if username not in self._history_data["accounts"]:
-                self._history_data["accounts"][username] = {
-                    "history": [],
-                    "last_sign": "",
-                    "consecutive_days": 0,
-                    "total_days": 0
-                }
-            
             # 添加签到记录
             record = {
                 "date": current_date,
@@ -85,27 +289,87 @@ class HistoryManager:
                 "reward": int(sign_data.get("积分奖励", 0)),
                 "total_days": int(sign_data.get("总天数", 0))
             }
+            # 签到耗时数据，供运行规划估算使用
+            for key in ("durations", "elapsed", "login_path"):
+                if sign_data.get(key) is not None:
+                    record[key] = sign_data[key]
             
-            # 更新账号信息
-            self._history_data["accounts"][username]["history"].append(record)
-            self._history_data["accounts"][username]["last_sign"] = current_date
-            self._history_data["accounts"][username]["consecutive_days"] = int(sign_data.get("连续签到", 0))
-            self._history_data["accounts"][username]["total_days"] = int(sign_data.get("总天数", 0))
-            
-            # 保存历史记录
-            self.save_history()
+            with self._lock:
+                # 收集模式下只暂存记录
+                if self._collected is not None:
+                    self._collected.append((username, record))
+                    return True
+                
+                self._apply_record(username, record)
+                # 保存历史记录
+                self.save_history()
             return True
         except Exception as e:
             logger.error(f"添加签到记录失败: {str(e)}")
             return False
     
+    def add_task_record(self, username, task_name, result):
+        """添加附加任务记录
+        
+        Args:
+            username: 账号
+            task_name: 任务名
+            result: 任务返回的结果，status之外的字段保存在data中
+        """
+        try:
+            now = datetime.now()
+            data = {key: value for key, value in result.items() if key != 'status'}
+            record = {
+                "date": now.strftime("%Y-%m-%d"),
+                "time": now.strftime("%H:%M:%S"),
+                "task": task_name,
+                "status": result.get("status", "unknown"),
+                "data": data
+            }
+            
+            with self._lock:
+                # 收集模式下只暂存记录
+                if self._collected is not None:
+                    self._collected.append((username, record))
+                    return True
+                
+                self._apply_record(username, record)
+                self.save_history()
+            return True
+        except Exception as e:
+            logger.error(f"添加任务记录失败: {str(e)}")
+            return False
+    
+    def task_done_today(self, username, task_name):
+        """判断账号今天是否已成功执行过指定任务"""
+        today = datetime.now().strftime("%Y-%m-%d")
+        with self._lock:
+            for collected_username, record in self._collected or []:
+                if (collected_username == username and record.get("task") == task_name
+                        and record["date"] == today and record["status"] == "success"):
+                    return True
+            header = self.history_data["accounts"].get(username) or {}
+            latest = header.get("tasks", {}).get(task_name)
+            return bool(latest) and latest["date"] == today and latest["status"] == "success"
+    
+    def get_task_records(self, username, months=None):
+        """获取账号的附加任务记录，按时间顺序排列"""
+        with self._lock:
+            partition_months = sorted(self.history_data["partitions"])
+            if months is not None:
+                partition_months = partition_months[-months:] if months > 0 else []
+            records = []
+            for month in partition_months:
+                records.extend(self._get_partition(month).get(TASKS_KEY, {}).get(username, []))
+            return records
+    
     def add_daily_summary(self, summary_data):
         """添加每日签到汇总"""
         try:
             current_date = datetime.now().strftime("%Y-%m-%d")
             
             # 添加每日汇总
-            self._history_data["summary"][current_date] = summary_data
+            self.history_data["summary"][current_date] = summary_data
             
             # 保存历史记录
             self.save_history()
@@ -114,24 +378,66 @@ class HistoryManager:
             logger.error(f"添加每日汇总失败: {str(e)}")
             return False
     
-    def get_account_history(self, username):
-        """获取账号签到历史"""
+    def get_account_records(self, username, months=None):
+        """获取账号的签到记录，按时间顺序排列
+        
+        Args:
+            username: 账号
+            months: 只读取最近几个月的分区，None表示全部
+        """
+        with self._lock:
+            partition_months = sorted(self.history_data["partitions"])
+            if months is not None:
+                partition_months = partition_months[-months:] if months > 0 else []
+            records = []
+            for month in partition_months:
+                records.extend(self._get_partition(month).get(username, []))
+            return records
+    
+    def get_account_history(self, username, months=None):
+        """获取账号签到历史
+        
+        Returns:
+            dict: 索引中的账号信息，history为签到记录列表（months指定时只包含最近几个月）
+        """
         try:
-            if username in self._history_data["accounts"]:
-                return self._history_data["accounts"][username]
-            return None
+            header = self.history_data["accounts"].get(username)
+            if header is None:
+                return None
+            account = dict(header)
+            account["history"] = self.get_account_records(username, months)
+            return account
         except Exception as e:
             logger.error(f"获取账号历史失败: {str(e)}")
             return None
     
+    def get_latest_record(self, username):
+        """获取账号最近一条签到记录，收集模式下优先返回尚未合并的记录"""
+        try:
+            with self._lock:
+                for collected_username, record in reversed(self._collected or []):
+                    if collected_username == username and "task" not in record:
+                        return record
+                
+                # 最近一条记录一定在最后签到日期所在的分区中，只需加载该分区
+                header = self.history_data["accounts"].get(username)
+                if not header or not header.get("last_sign"):
+                    return None
+                partition = self._get_partition(_month_of(header["last_sign"]))
+                records = (partition or {}).get(username)
+                return records[-1] if records else None
+        except Exception as e:
+            logger.error(f"获取最近签到记录失败: {str(e)}")
+            return None
+    
     def get_daily_summary(self, date=None):
         """获取每日签到汇总"""
         try:
             if date is None:
                 date = datetime.now().strftime("%Y-%m-%d")
-                
-            if date in self._history_data["summary"]:
-                return self._history_data["summary"][date]
+            
+            if date in self.history_data["summary"]:
+                return self.history_data["summary"][date]
             return None
         except Exception as e:
             logger.error(f"获取每日汇总失败: {str(e)}")
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import gzip
+import time
+import socket
+import base64
+import threading
+from collections import defaultdict, deque
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode, quote, quote_plus
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from requests.exceptions import ConnectionError, RequestException
+
+from .logger import logger
+from .serializer import dumps, dumps_line, loads
+
+# 需要脱敏的参数名（URL查询参数、表单字段和JSON响应字段）
+SECRET_FIELDS = {
+    'password', 'answer', 'client_id', 'client_secret', 'access_token',
+    'refresh_token', 'session_secret', 'session_key',
+}
+# 以这些前缀开头的字段同样脱敏，如Discuz登录表单中以输入框id命名的密码字段 password3_LXy9d
+SECRET_FIELD_PREFIXES = ('password',)
+# 需要脱敏的请求/响应头
+SECRET_HEADERS = {'cookie', 'set-cookie', 'authorization'}
+# 体积较大且无需比对的字段（如验证码图片）
+OMITTED_FIELDS = {'image'}
+REDACTED = '***'
+# 按值脱敏的最短长度，更短的值（如安全提问答案"1"）容易与普通参数（inajax=1）重合，只按字段名脱敏
+MIN_SECRET_LENGTH = 4
+
+def _is_secret_field(key):
+    """判断字段名是否需要脱敏"""
+    key = key.lower()
+    return key in SECRET_FIELDS or key.startswith(SECRET_FIELD_PREFIXES)
+
+def _redact_query(query, secrets=()):
+    """脱敏查询字符串或表单数据中的敏感字段
+
+    Args:
+        query: 查询字符串或表单数据
+        secrets: 已知的敏感值（账号密码、安全提问答案等），字段值与之相同时无论字段名都脱敏
+    """
+    pairs = parse_qsl(query, keep_blank_values=True)
+    if not pairs:
+        return query
+    redacted = []
+    for key, value in pairs:
+        if _is_secret_field(key) or (value and value in secrets):
+            value = REDACTED
+        elif key.lower() in OMITTED_FIELDS:
+            value = '<omitted>'
+        redacted.append((key, value))
+    return urlencode(redacted)
+
+def redact_url(url, secrets=()):
+    """脱敏URL中的敏感查询参数"""
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, _redact_query(parts.query, secrets), parts.fragment))
+
+def _redact_body(body, secrets=()):
+    """脱敏请求体，仅处理表单格式的文本"""
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+    # 只对表单格式的请求体做脱敏，其余内容不记录
+    if '=' not in body or not re.match(r'^[\w%.\-*+]+=', body):
+        return None
+    return _redact_query(body, secrets)
+
+def _redact_json(value, found):
+    """递归脱敏JSON对象中的敏感字段，被脱敏的字符串值加入found"""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if _is_secret_field(str(key)) and not isinstance(item, (dict, list)):
+                if isinstance(item, str) and item:
+                    found.add(item)
+                result[key] = REDACTED
+            else:
+                result[key] = _redact_json(item, found)
+        return result
+    if isinstance(value, list):
+        return [_redact_json(item, found) for item in value]
+    return value
+
+def _redact_response_body(content, headers, found):
+    """脱敏JSON响应体（如百度OCR的/oauth/2.0/token返回的access_token），其他响应体原样返回"""
+    content_type = headers.get('Content-Type', '').lower()
+    if not content or ('json' not in content_type and content.lstrip()[:1] not in (b'{', b'[')):
+        return content
+    try:
+        data = loads(content)
+    except ValueError:
+        return content
+    redacted = _redact_json(data, found)
+    return content if redacted == data else dumps(redacted)
+
+def _secret_variants(secret):
+    """敏感值在磁带中可能出现的形式：原文、URL编码和表单编码"""
+    return {secret, quote(secret, safe=''), quote_plus(secret)}
+
+def _redact_set_cookie(value):
+    """保留Cookie名称，脱敏Cookie值"""
+    # 多个Cookie会被合并为逗号分隔的一行，逐个处理
+    return re.sub(r'(^|,\s*)([^=;,\s]+)=[^;,]*', lambda m: f'{m.group(1)}{m.group(2)}={REDACTED}', value)
+
+def _redact_headers(headers):
+    """脱敏请求/响应头"""
+    result = {}
+    for key, value in headers.items():
+        if key.lower() == 'set-cookie':
+            result[key] = _redact_set_cookie(value)
+        elif key.lower() in SECRET_HEADERS:
+            result[key] = REDACTED
+        else:
+            result[key] = value
+    return result
+
+# 单个响应体的默认字节上限，超过时中止读取
+DEFAULT_MAX_RESPONSE_BYTES = 2 * 1024 * 1024
+# 流式读取响应体的块大小
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+class ResponseTooLarge(RequestException):
+    """响应体超过request.max_response_bytes"""
+
+def read_capped(response, max_bytes, deadline=None):
+    """在字节上限内读取流式响应的响应体，读取完成后连接立即归还连接池
+
+    Args:
+        response: 以stream=True发送的请求的响应
+        max_bytes: 响应体字节上限，0表示不限制
+        deadline: 时间预算，每读取一块检查一次，避免缓慢滴流的响应体无限拖延
+
+    Raises:
+        ResponseTooLarge: 声明的或实际读取的长度超过上限
+        DeadlineExceeded: 读取过程中超出时间预算
+    """
+    # 已读取过响应体（录制或回放适配器返回的响应）时没有可关闭的连接，只检查长度
+    if response._content is not False:
+        if max_bytes and len(response._content or b'') > max_bytes:
+            raise ResponseTooLarge(f"响应体超过 {max_bytes} 字节上限: {len(response._content)} 字节")
+        return response
+
+    try:
+        declared = response.headers.get('Content-Length', '')
+        if max_bytes and declared.isdigit() and int(declared) > max_bytes:
+            raise ResponseTooLarge(f"响应体超过 {max_bytes} 字节上限: Content-Length {declared}")
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(RESPONSE_CHUNK_SIZE):
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise ResponseTooLarge(f"响应体超过 {max_bytes} 字节上限")
+            if deadline is not None:
+                deadline.check()
+            chunks.append(chunk)
+        response._content = b''.join(chunks)
+        response._content_consumed = True
+        return response
+    finally:
+        response.close()
+
+def abort_response(response):
+    """中断正在读取的流式响应：关闭底层socket，使其他线程中阻塞的读取立即出错返回"""
+    try:
+        fd = response.raw.fileno()
+    except (AttributeError, OSError, ValueError):
+        # 回放的响应没有底层连接，已读取完毕的响应连接已归还连接池
+        return False
+    # 借用文件描述符关闭读写方向，不接管其所有权
+    sock = socket.socket(fileno=fd)
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    finally:
+        sock.detach()
+    return True
+
+class CassetteLeakError(Exception):
+    """录制结果中出现了已知的敏感值"""
+
+class Cassette:
+    """录制的HTTP交互集合，按账号、请求方法和脱敏后的URL顺序匹配"""
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        # 按录制顺序排列的账号，回放时按同样的顺序签到
+        self.accounts = []
+        # 已知的敏感值：账号密码、安全提问答案、API密钥，以及录制过程中从响应中脱敏的令牌
+        self.secrets = set()
+        self._queues = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def add_secrets(self, *values):
+        """登记敏感值，表单和查询参数中与之相同的值都会被脱敏"""
+        with self._lock:
+            self.secrets.update(str(value) for value in values if value and len(str(value)) >= MIN_SECRET_LENGTH)
+
+    def _key(self, method, url):
+        return f'{method.upper()} {redact_url(url, self.secrets)}'
+
+    def _add_entry(self, entry):
+        account = entry.get('account')
+        if account is not None and account not in self.accounts:
+            self.accounts.append(account)
+        self.entries.append(entry)
+        self._queues[(account, entry['key'])].append(entry)
+
+    def load(self):
+        """从磁盘加载磁带文件（gzip压缩的JSON Lines）"""
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    self._add_entry(loads(line))
+        logger.info(f"已加载HTTP回放磁带: {self.path}，共 {len(self.entries)} 条记录")
+
+    def find_leaks(self, lines):
+        """检查编码后的磁带行中是否出现已知的敏感值
+
+        Returns:
+            list: 出现敏感值的记录URL（已脱敏）
+        """
+        variants = set()
+        for secret in self.secrets:
+            variants.update(_secret_variants(secret))
+        # 响应体以base64保存，需要解码后再检查
+        leaks = []
+        for entry, line in zip(self.entries, lines):
+            body = base64.b64decode(entry['body']).decode('utf-8', 'replace')
+            if any(variant in line or variant in body for variant in variants):
+                leaks.append(f"{entry['method']} {entry['url']}")
+        return leaks
+
+    def save(self):
+        """将录制结果写入磁盘，发现未脱敏的敏感值时拒绝保存
+
+        Raises:
+            CassetteLeakError: 磁带中出现已知的敏感值
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            lines = [dumps_line(entry) for entry in self.entries]
+            leaks = self.find_leaks(lines)
+            if leaks:
+                raise CassetteLeakError(f"磁带中存在未脱敏的敏感值，已拒绝保存: {', '.join(leaks[:5])}")
+            with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line)
+                    f.write('\n')
+        logger.info(f"HTTP录制磁带已保存: {self.path}，共 {len(self.entries)} 条记录")
+
+    def append(self, request, response, elapsed, account=None):
+        """记录一次HTTP交互
+
+        Args:
+            account: 发起请求的账号，不属于某个账号的请求（如OCR）为None
+        """
+        tokens = set()
+        body = _redact_response_body(response.content or b'', response.headers, tokens)
+        with self._lock:
+            # 响应中的令牌之后可能出现在其他请求里，一并登记为敏感值
+            self.secrets.update(token for token in tokens if len(token) >= MIN_SECRET_LENGTH)
+            secrets = set(self.secrets)
+        entry = {
+            'account': account,
+            'key': f'{request.method.upper()} {redact_url(request.url, secrets)}',
+            'method': request.method,
+            'url': redact_url(request.url, secrets),
+            'request_body': _redact_body(request.body, secrets),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': _redact_headers(response.headers),
+            'body': base64.b64encode(body).decode('ascii'),
+            'elapsed': round(elapsed, 4)
+        }
+        with self._lock:
+            self._add_entry(entry)
+
+    def next_entry(self, method, url, account=None):
+        """取出该账号与请求匹配的下一条记录，没有则返回None"""
+        with self._lock:
+            # 旧版磁带没有记录账号，所有请求按顺序匹配
+            if not self.accounts:
+                account = None
+            queue = self._queues.get((account, self._key(method, url)))
+            if not queue:
+                return None
+            return queue.popleft()
+
+class RecordingAdapter(HTTPAdapter):
+    """录制适配器：正常发送请求，同时把交互写入磁带"""
+    def __init__(self, cassette, max_response_bytes=0, account=None, *args, **kwargs):
+        self.cassette = cassette
+        self.max_response_bytes = max_response_bytes
+        self.account = account
+        super(RecordingAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        start = time.time()
+        kwargs['stream'] = True
+        response = super(RecordingAdapter, self).send(request, **kwargs)
+        # 在字节上限内读取完整响应体以便录制，requests会缓存该内容
+        read_capped(response, self.max_response_bytes)
+        self.cassette.append(request, response, time.time() - start, self.account)
+        return response
+
+class ReplayAdapter(BaseAdapter):
+    """回放适配器：从磁带中按顺序返回录制的响应"""
+    def __init__(self, cassette, replay_timing=False, account=None):
+        super(ReplayAdapter, self).__init__()
+        self.cassette = cassette
+        self.replay_timing = replay_timing
+        self.account = account
+
+    def send(self, request, **kwargs):
+        entry = self.cassette.next_entry(request.method, request.url, self.account)
+        if entry is None:
+            raise ConnectionError(f"回放磁带中没有匹配的请求: {request.method} {redact_url(request.url)}", request=request)
+
+        if self.replay_timing and entry.get('elapsed'):
+            time.sleep(entry['elapsed'])
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry.get('reason')
+        response.headers = CaseInsensitiveDict(entry.get('headers', {}))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = base64.b64decode(entry['body'])
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+class HttpRecorder:
+    """HTTP录制/回放管理类，负责为会话挂载录制或回放适配器"""
+    _instance = None  # 单例模式实例
+
+    def __new__(cls):
+        """实现单例模式"""
+        if cls._instance is None:
+            cls._instance = super(HttpRecorder, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化HTTP录制管理器"""
+        if self._initialized:
+            return
+
+        self.mode = 'live'  # live / record / replay
+        self.cassette = None
+        self.replay_timing = False
+        self._initialized = True
+
+    def configure(self, mode='live', cassette_file=None, replay_timing=False):
+        """配置录制模式
+
+        Args:
+            mode: live为直连，record为录制，replay为回放
+            cassette_file: 磁带文件路径
+            replay_timing: 回放时是否按录制的耗时等待
+        """
+        if mode not in ('live', 'record', 'replay'):
+            raise ValueError(f"未知的HTTP模式: {mode}")
+        self.mode = mode
+        self.replay_timing = replay_timing
+        self.cassette = None
+        if mode == 'live':
+            return
+        if not cassette_file:
+            raise ValueError("录制或回放模式需要指定磁带文件")
+        self.cassette = Cassette(cassette_file)
+        if mode == 'replay':
+            self.cassette.load()
+        logger.info(f"HTTP模式: {mode}，磁带文件: {cassette_file}")
+
+    @property
+    def is_replay(self):
+        return self.mode == 'replay'
+
+    def add_secrets(self, *values):
+        """登记录制时需要脱敏的敏感值（账号密码、安全提问答案、API密钥）"""
+        if self.cassette is not None:
+            self.cassette.add_secrets(*values)
+
+    def mount(self, session, max_response_bytes=0, account=None):
+        """为会话挂载录制或回放适配器
+
+        Args:
+            session: requests会话
+            max_response_bytes: 录制时的响应体字节上限，0表示不限制
+            account: 会话所属的账号，回放时只匹配该账号录制的请求
+        """
+        if self.mode == 'record':
+            adapter = RecordingAdapter(self.cassette, max_response_bytes, account)
+        elif self.mode == 'replay':
+            adapter = ReplayAdapter(self.cassette, self.replay_timing, account)
+        else:
+            return session
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def order_accounts(self, accounts):
+        """回放时按磁带中录制的顺序排列账号，磁带中没有的账号被跳过
+
+        Args:
+            accounts: 账号信息列表
+
+        Returns:
+            list: 排序后的账号信息列表
+        """
+        recorded = self.cassette.accounts
+        if not recorded:
+            return accounts
+        by_name = {account['username']: account for account in accounts}
+        missing = [name for name in by_name if name not in recorded]
+        if missing:
+            logger.warning(f"回放磁带中没有以下账号的记录，本次跳过: {', '.join(missing)}")
+        return [by_name[name] for name in recorded if name in by_name]
+
+    def save(self):
+        """保存录制结果，仅在录制模式下生效"""
+        if self.mode != 'record' or self.cassette is None:
+            return False
+        try:
+            self.cassette.save()
+            return True
+        except Exception as e:
+            logger.error(f"保存HTTP录制磁带失败: {str(e)}")
+            return False
+
+# 创建全局HTTP录制管理器实例
+http_recorder = HttpRecorder()
@@ -22,7 +22,7 @@ class LoggerManager:
             return
             
         self._initialized = True
-        self.setup_logger()
+        # 日志目录和文件处理器在首次记录日志时才创建
     
     def setup_logger(self):
         """配置日志记录器"""
@@ -63,9 +63,16 @@ class LoggerManager:
         self._logger = logger
     
     def get_logger(self):
-        """获取日志记录器"""
+        """获取日志记录器，首次调用时完成配置"""
+        if self._logger is None:
+            self.setup_logger()
         return self._logger
 
+class _LazyLogger:
+    """日志记录器代理，首次使用时才配置日志处理器"""
+    def __getattr__(self, name):
+        return getattr(logger_manager.get_logger(), name)
+
 # 创建全局日志管理器实例
 logger_manager = LoggerManager()
-logger = logger_manager.get_logger()
+logger = _LazyLogger()
@@ -1,114 +1,399 @@
 # -*- coding: utf-8 -*-
 import os
+import re
+import time
+import random
 import base64
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import requests
 from requests.exceptions import Timeout
 
 from .logger import logger
 from .config_manager import config_manager
+from .http_recorder import http_recorder
+from .captcha_preprocess import preprocess, DEFAULT_PROFILES
+from .deadline import Deadline, DeadlineExceeded
+
+# 百度OCR支持的识别接口
+BAIDU_BACKENDS = ('accurate_basic', 'general_basic', 'accurate', 'general', 'webimage')
+# 没有置信度输出的识别器在投票时使用的默认权重
+DEFAULT_CONFIDENCE = 0.5
+# Discuz验证码使用的字符集
+DEFAULT_ALPHABET = 'BCEFGHJKMPQRTVWXY2346789'
+# 常见的识别混淆字符，映射到字符集中外形相近的字符
+DEFAULT_CHAR_MAP = {'O': 'Q', '0': 'Q', 'D': 'Q', 'I': 'T', '1': 'T', 'Z': '2', 'A': '4'}
 
 class OCRManager:
     """OCR管理类，负责验证码识别"""
     _instance = None  # 单例模式实例
-    
+
     def __new__(cls):
         """实现单例模式"""
         if cls._instance is None:
             cls._instance = super(OCRManager, cls).__new__(cls)
             cls._instance._initialized = False
         return cls._instance
-    
+
     def __init__(self):
         """初始化OCR管理器"""
         if self._initialized:
             return
-            
-        # 获取API配置
+
+        self.session = None
+        self._settings_loaded = False
+        self._access_token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+        self._executor = None
+        # 同时识别验证码的签到线程数，由并发签到入口设置
+        self.concurrency = 1
+        self._local_recognizer = None
+        self._broker_client = None
+
+        self._initialized = True
+
+    def _ensure_settings(self):
+        """首次使用时读取API配置"""
+        if self._settings_loaded:
+            return
         self.api_key = config_manager.get('api', 'baidu_ocr', {}).get('api_key', '')
         self.secret_key = config_manager.get('api', 'baidu_ocr', {}).get('secret_key', '')
-        self.request_timeout = config_manager.get('request', 'timeout', 30)
+        http_recorder.add_secrets(self.api_key, self.secret_key)
+        request_timeout = config_manager.get('request', 'timeout', 30)
+        self.request_timeout = (
+            config_manager.get('request', 'connect_timeout', min(10, request_timeout)),
+            config_manager.get('request', 'read_timeout', request_timeout)
+        )
         self.max_retries = config_manager.get('request', 'max_retries', 3)
         self.retry_delay = config_manager.get('request', 'retry_delay', 3)
+
+        # 多识别器配置
+        ocr_config = config_manager.get('api', 'ocr', {})
+        self.backends = ocr_config.get('backends', ['accurate_basic'])
+        self.min_confidence = ocr_config.get('min_confidence', 0.85)
+        self.captcha_length = ocr_config.get('captcha_length', 4)
+        self.alphabet = ocr_config.get('alphabet', DEFAULT_ALPHABET)
+        self.char_map = ocr_config.get('char_map', DEFAULT_CHAR_MAP)
         
-        self._initialized = True
-    
-    def get_access_token(self):
-        """获取百度OCR API的access_token"""
-        for attempt in range(self.max_retries):
+        # 预处理方案，配置为列表时每次随机选择一个，便于对比各方案的识别率
+        preprocess_config = ocr_config.get('preprocess', {})
+        self.preprocess_profile = preprocess_config.get('profile', 'default')
+        self.preprocess_profiles = dict(DEFAULT_PROFILES)
+        self.preprocess_profiles.update(preprocess_config.get('profiles', {}))
+        self.preprocess_options = preprocess_config.get('options', {})
+        
+        # 启用OCR代理时，识别请求交给本机共享的代理进程
+        from .ocr_broker import broker_settings
+        self.broker_settings = broker_settings()
+        self.use_broker = self.broker_settings['enabled']
+        self._settings_loaded = True
+
+    def get_session(self):
+        """获取OCR请求使用的会话，首次调用时创建"""
+        if self.session is None:
+            self.session = http_recorder.mount(requests.Session())
+        return self.session
+
+    def _timeout(self, deadline=None):
+        """计算识别请求的(连接, 读取)超时，有时间预算时不超过剩余时间"""
+        if deadline is None:
+            return self.request_timeout
+        deadline.check()
+        return tuple(deadline.cap(value) for value in self.request_timeout)
+
+    def _sleep(self, seconds, deadline=None):
+        """重试前等待，有时间预算时不超过剩余时间"""
+        if deadline is None:
+            time.sleep(seconds)
+        else:
+            deadline.sleep(seconds)
+
+    def get_access_token(self, deadline=None):
+        """获取百度OCR API的access_token，有效期内复用缓存"""
+        self._ensure_settings()
+        with self._token_lock:
+            if self._access_token and time.time() < self._token_expires_at:
+                return self._access_token
+
+            for attempt in range(self.max_retries):
+                try:
+                    url = "https://aip.baidubce.com/oauth/2.0/token"
+                    params = {"grant_type": "client_credentials", "client_id": self.api_key, "client_secret": self.secret_key}
+                    response = self.get_session().post(url, params=params, timeout=self._timeout(deadline))
+                    if response.status_code != 200 or "access_token" not in response.json():
+                        logger.error(f"获取access_token失败: {response.text}")
+                        continue
+                    result = response.json()
+                    self._access_token = str(result.get("access_token"))
+                    # 提前一小时过期，避免临界时刻失效
+                    self._token_expires_at = time.time() + max(0, int(result.get("expires_in", 0)) - 3600)
+                    return self._access_token
+                except Timeout:
+                    logger.warning(f"获取access_token超时，第{attempt+1}次尝试")
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    logger.error(f"获取access_token出错: {str(e)}")
+
+                # 如果不是最后一次尝试，则等待后重试
+                if attempt < self.max_retries - 1:
+                    self._sleep(self.retry_delay, deadline)
+
+            logger.error(f"获取access_token失败，已达到最大重试次数")
+            return None
+
+    def clean_text(self, text):
+        """清理识别结果：只保留字母和数字，并按验证码字符集纠正和过滤"""
+        text = re.sub(r'[^a-zA-Z0-9]', '', text or '')
+        if not self.alphabet:
+            return text
+        # 验证码不区分大小写，统一转为大写后纠正混淆字符
+        text = ''.join(self.char_map.get(char, char) for char in text.upper())
+        return ''.join(char for char in text if char in self.alphabet)
+
+    def is_valid(self, text):
+        """检查识别结果是否符合验证码格式"""
+        if not text:
+            return False
+        return not self.captcha_length or len(text) == self.captcha_length
+
+    def _recognize_baidu(self, endpoint, image_bytes, deadline=None):
+        """调用百度OCR接口识别
+
+        Returns:
+            tuple: (识别文本, 置信度)，失败返回(None, None)
+        """
+        access_token = self.get_access_token(deadline)
+        if not access_token:
+            return None, None
+
+        url = f"https://aip.baidubce.com/rest/2.0/ocr/v1/{endpoint}?access_token={access_token}"
+        image_data = urllib.parse.quote_plus(base64.b64encode(image_bytes).decode("utf8"))
+
+        # 构建请求，开启probability以获取置信度
+        payload = f'image={image_data}&detect_direction=false&paragraph=false&probability=true'
+        headers = {
+            'Content-Type': 'application/x-www-form-urlencoded',
+            'Accept': 'application/json'
+        }
+
+        response = self.get_session().request("POST", url, headers=headers, data=payload.encode("utf-8"), timeout=self._timeout(deadline))
+        result = response.json()
+
+        if 'words_result' not in result or not result['words_result']:
+            logger.error(f"验证码识别失败({endpoint}): {result}")
+            return None, None
+
+        words = result['words_result'][0]
+        probability = words.get('probability', {})
+        confidence = probability.get('average') if isinstance(probability, dict) else None
+        return self.clean_text(words.get('words')), confidence
+
+    def _get_local_recognizer(self):
+        """加载本地识别器（可选依赖ddddocr），未安装时返回None"""
+        if self._local_recognizer is None:
             try:
-                url = "https://aip.baidubce.com/oauth/2.0/token"
-                params = {"grant_type": "client_credentials", "client_id": self.api_key, "client_secret": self.secret_key}
-                response = requests.post(url, params=params, timeout=self.request_timeout)
-                if response.status_code != 200 or "access_token" not in response.json():
-                    logger.error(f"获取access_token失败: {response.text}")
-                    continue
-                return str(response.json().get("access_token"))
-            except Timeout:
-                logger.warning(f"获取access_token超时，第{attempt+1}次尝试")
-            except Exception as e:
-                logger.error(f"获取access_token出错: {str(e)}")
-                
-            # 如果不是最后一次尝试，则等待后重试
-            if attempt < self.max_retries - 1:
-                import time
-                time.sleep(self.retry_delay)
-                
-        logger.error(f"获取access_token失败，已达到最大重试次数")
-        return None
+                import ddddocr
+                self._local_recognizer = ddddocr.DdddOcr(show_ad=False)
+            except ImportError:
+                logger.warning("未安装ddddocr，本地验证码识别器不可用")
+                self._local_recognizer = False
+        return self._local_recognizer or None
+
+    def _recognize_local(self, image_bytes):
+        """使用本地识别器识别，本地识别器不提供置信度"""
+        recognizer = self._get_local_recognizer()
+        if recognizer is None:
+            return None, None
+        return self.clean_text(recognizer.classification(image_bytes)), None
+
+    def _get_broker_client(self):
+        """获取OCR代理客户端，未启用代理或处于HTTP录制/回放模式时返回None"""
+        if not self.use_broker or http_recorder.mode != 'live':
+            return None
+        if self._broker_client is None:
+            from .ocr_broker import OCRBrokerClient
+            self._broker_client = OCRBrokerClient(self.broker_settings['address'], self.broker_settings['timeout'])
+        return self._broker_client
+
+    def _recognize_with(self, backend, image_bytes, deadline=None):
+        """使用指定识别器识别，异常时返回(None, None)，超出时间预算时抛出DeadlineExceeded"""
+        client = self._get_broker_client()
+        if client is not None:
+            from .ocr_broker import BrokerError, BrokerBusy, BrokerUnavailable, BUSY_RETRY_DELAY
+            # 代理排队已满时在等待时间内重试，只有连不上代理时才回退为直接调用
+            budget = Deadline(self.broker_settings['timeout'], parent=deadline)
+            while True:
+                try:
+                    if deadline is not None:
+                        deadline.check()
+                    text, confidence = client.recognize(backend, image_bytes, budget.remaining())
+                    return self.clean_text(text), confidence
+                except BrokerBusy as e:
+                    remaining = budget.remaining()
+                    if remaining is not None and remaining <= BUSY_RETRY_DELAY:
+                        logger.error(f"验证码识别失败({backend}): {str(e)}")
+                        return None, None
+                    logger.warning(f"{str(e)}，{BUSY_RETRY_DELAY:g}秒后重试({backend})")
+                    budget.sleep(BUSY_RETRY_DELAY)
+                except BrokerUnavailable as e:
+                    if not self.broker_settings['fallback']:
+                        logger.error(f"验证码识别失败({backend}): {str(e)}")
+                        return None, None
+                    logger.warning(f"{str(e)}，改为直接调用识别接口")
+                    break
+                except BrokerError as e:
+                    logger.error(f"验证码识别失败({backend}): {str(e)}")
+                    return None, None
+        try:
+            if backend == 'local':
+                return self._recognize_local(image_bytes)
+            if backend in BAIDU_BACKENDS:
+                return self._recognize_baidu(backend, image_bytes, deadline)
+            logger.error(f"未知的验证码识别器: {backend}")
+        except Timeout:
+            logger.error(f"验证码识别请求超时({backend})")
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"验证码识别过程出错({backend}): {str(e)}")
+        return None, None
+
+    def _get_executor(self):
+        """获取识别线程池，首次调用时创建"""
+        if self._executor is None:
+            # 每个签到线程的每个识别器各占一个线程，并发签到时识别请求不会互相排队
+            self._executor = ThreadPoolExecutor(max_workers=max(1, self.concurrency) * len(self.backends),
+                                                thread_name_prefix='ocr')
+        return self._executor
+
+    def vote(self, answers):
+        """对多个识别器的结果投票
+
+        Args:
+            answers: [(识别器, 文本, 置信度)] 列表
+
+        Returns:
+            str: 格式正确的结果中得票最高的一个，没有格式正确的结果时返回None
+        """
+        # 长度不符的结果提交后必然被拒绝，白白消耗一次登录请求，不参与投票
+        candidates = [answer for answer in answers if self.is_valid(answer[1])]
+        if not candidates:
+            return None
+
+        scores = {}
+        for _, text, confidence in candidates:
+            # 验证码不区分大小写，按小写归并计票
+            key = text.lower()
+            score, best = scores.get(key, (0, None))
+            weight = confidence if confidence is not None else DEFAULT_CONFIDENCE
+            if best is None or weight > best[1]:
+                best = (text, weight)
+            scores[key] = (score + weight, best)
+        return max(scores.values(), key=lambda item: item[0])[1][0]
+
+    def _choose_profile(self):
+        """选择本次使用的预处理方案"""
+        profile = self.preprocess_profile
+        if isinstance(profile, list):
+            profile = random.choice(profile) if profile else 'none'
+        return profile
+
+    def _preprocess(self, image_bytes, profile):
+        """按方案预处理图片，失败时使用原图"""
+        try:
+            steps = self.preprocess_profiles.get(profile)
+            if steps is None:
+                logger.warning(f"未知的验证码预处理方案: {profile}，使用原图")
+                return image_bytes
+            return preprocess(image_bytes, steps, self.preprocess_options)
+        except Exception as e:
+            logger.error(f"验证码预处理失败({profile}): {str(e)}，使用原图")
+            return image_bytes
 
     def recognize_captcha(self, image_path):
         """识别验证码
-        
+
         Args:
             image_path: 验证码图片路径
-            
+
         Returns:
             str: 识别结果，失败返回None
         """
+        return self.recognize(image_path)['text']
+
+    def recognize(self, image_path, deadline=None):
+        """识别验证码并返回识别信息
+
+        先按预处理方案处理图片，再同时发送给所有已配置的识别器，取第一个满足置信度和
+        格式要求的结果；都不满足时对全部结果投票。
+
+        Args:
+            image_path: 验证码图片路径
+            deadline: 时间预算，识别请求的超时、重试等待和等待各识别器的时间都不超过剩余预算
+
+        Raises:
+            DeadlineExceeded: 识别过程中超出时间预算
+
+        Returns:
+            dict: {text, backend, confidence, profile}，识别失败时text为None
+        """
+        self._ensure_settings()
+        profile = self._choose_profile()
+        recognition = {'text': None, 'backend': None, 'confidence': None, 'profile': profile}
         try:
-            # 获取access_token
-            access_token = self.get_access_token()
-            if not access_token:
-                return None
-                
-            url = f"https://aip.baidubce.com/rest/2.0/ocr/v1/accurate_basic?access_token={access_token}"
-            
-            # 读取图片并转为base64
             with open(image_path, "rb") as f:
-                image_data = base64.b64encode(f.read()).decode("utf8")
-                image_data = urllib.parse.quote_plus(image_data)
-            
-            # 构建请求
-            payload = f'image={image_data}&detect_direction=false&paragraph=false&probability=false'
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'Accept': 'application/json'
-            }
-            
-            # 发送请求
-            response = requests.request("POST", url, headers=headers, data=payload.encode("utf-8"), timeout=self.request_timeout)
-            result = response.json()
-            
-            # 解析结果
-            if 'words_result' not in result or not result['words_result']:
-                logger.error(f"验证码识别失败: {result}")
-                return None
-                
-            captcha_text = result['words_result'][0]['words']
-            # 清理验证码文本，移除空格和特殊字符
-            import re
-            captcha_text = re.sub(r'[\s+]', '', captcha_text)
-            # 确保验证码只包含字母和数字
-            captcha_text = re.sub(r'[^a-zA-Z0-9]', '', captcha_text)
-            logger.info(f"验证码识别结果: {captcha_text}")
-            return captcha_text
-        except Timeout:
-            logger.error(f"验证码识别请求超时")
-            return None
+                image_bytes = f.read()
         except Exception as e:
-            logger.error(f"验证码识别过程出错: {str(e)}")
-            return None
+            logger.error(f"读取验证码图片失败: {str(e)}")
+            return recognition
+        image_bytes = self._preprocess(image_bytes, profile)
+
+        if len(self.backends) == 1:
+            backend = self.backends[0]
+            text, confidence = self._recognize_with(backend, image_bytes, deadline)
+            if text and not self.is_valid(text):
+                # 格式不符时返回None，由调用方直接换一张验证码而不是提交
+                logger.warning(f"验证码识别结果格式不符，已丢弃: {text} ({backend}, 预处理: {profile})")
+                text = None
+            if text:
+                logger.info(f"验证码识别结果: {text} ({backend}, 置信度: {confidence}, 预处理: {profile})")
+            recognition.update(text=text or None, backend=backend, confidence=confidence)
+            return recognition
+
+        executor = self._get_executor()
+        pending = {executor.submit(self._recognize_with, backend, image_bytes, deadline): backend
+                   for backend in self.backends}
+        answers = []
+        while pending:
+            timeout = deadline.remaining() if deadline is not None else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 未完成的识别请求超时已限制在预算内，由线程池自行结束
+                raise DeadlineExceeded("验证码识别超出时间预算")
+            for future in done:
+                backend = pending.pop(future)
+                text, confidence = future.result()
+                if not text:
+                    continue
+                answers.append((backend, text, confidence))
+                # 置信度和格式都满足时直接采用，不再等待其他识别器
+                if confidence is not None and confidence >= self.min_confidence and self.is_valid(text):
+                    logger.info(f"验证码识别结果: {text} ({backend}, 置信度: {confidence:.3f}, 预处理: {profile})")
+                    recognition.update(text=text, backend=backend, confidence=confidence)
+                    return recognition
+
+        captcha_text = self.vote(answers)
+        if captcha_text:
+            logger.info(f"验证码识别结果(投票): {captcha_text}，候选: {answers}，预处理: {profile}")
+            recognition.update(text=captcha_text, backend='vote')
+        elif answers:
+            logger.warning(f"所有识别结果格式均不符，已丢弃: {answers}，预处理: {profile}")
+        else:
+            logger.error("所有识别器均未能识别验证码")
+        return recognition
 
 # 创建全局OCR管理器实例
 ocr_manager = OCRManager()
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import base64
+import socket
+import threading
+import socketserver
+
+from .logger import logger
+from .config_manager import config_manager
+from .serializer import dumps, loads
+
+# 默认配置：同一台机器上的所有签到进程通过该地址共享一个OCR代理
+DEFAULT_BROKER_CONFIG = {
+    "enabled": False,
+    "address": "127.0.0.1:8765",  # host:port，或 unix:/path/to/socket
+    "qps": 2,                      # 百度OCR免费额度的QPS限制
+    "max_queue": 100,              # 排队等待的请求数上限，超过时直接拒绝
+    "pool_size": 4,                # 到百度OCR的HTTP连接池大小
+    "timeout": 60,                 # 客户端等待一次识别结果的最长时间（秒）
+    "fallback": True               # 代理不可用时是否回退为进程内直接调用
+}
+
+class BrokerError(Exception):
+    """OCR代理返回错误、响应超时或连接在等待响应时断开"""
+
+class BrokerUnavailable(BrokerError):
+    """无法连接OCR代理，请求没有送达代理"""
+
+class BrokerBusy(BrokerError):
+    """OCR代理排队已满，拒绝了请求"""
+
+# 代理排队已满时，客户端等待多久后重试（秒）
+BUSY_RETRY_DELAY = 1.0
+
+def broker_settings():
+    """读取OCR代理配置，未配置的项使用默认值"""
+    settings = dict(DEFAULT_BROKER_CONFIG)
+    settings.update(config_manager.get('api', 'ocr', {}).get('broker', {}))
+    return settings
+
+def parse_address(address):
+    """解析代理地址
+
+    Returns:
+        tuple: (套接字族, 地址)，Unix套接字为路径，TCP为(host, port)
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+class RateLimiter:
+    """按固定间隔发放调用时间槽的限速器
+
+    每个请求领取下一个可用时间槽后等待到该时刻，多个线程按领取顺序依次放行，
+    等待中的请求数即为排队长度。
+    """
+    def __init__(self, qps, max_queue):
+        self.interval = 1.0 / qps if qps > 0 else 0
+        self.max_queue = max_queue
+        self._next_slot = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """等待一个调用时间槽，排队已满时返回False"""
+        with self._lock:
+            if self.max_queue and self._waiting >= self.max_queue:
+                return False
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            self._waiting += 1
+        try:
+            delay = slot - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            return True
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    @property
+    def waiting(self):
+        """当前排队等待的请求数"""
+        return self._waiting
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    """处理一个客户端连接，每行一个JSON请求，每行一个JSON响应"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = loads(line)
+                response = self.server.broker.dispatch(request)
+            except ValueError:
+                response = {"ok": False, "error": "请求格式错误"}
+            except Exception as e:
+                logger.error(f"OCR代理处理请求失败: {str(e)}")
+                response = {"ok": False, "error": str(e)}
+            try:
+                self.wfile.write(dumps(response) + b'\n')
+                self.wfile.flush()
+            except OSError:
+                # 客户端已超时断开
+                return
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixServer = None
+
+class OCRBroker:
+    """本机共享的OCR代理服务
+
+    持有唯一的access_token缓存和到百度OCR的连接池，所有识别请求按配置的QPS排队调用，
+    同一台机器上的多个签到进程通过它共享OCR额度，避免各自抢占QPS而被限流。
+    """
+
+    def __init__(self, address=None, qps=None, max_queue=None, pool_size=None):
+        settings = broker_settings()
+        self.address = address or settings['address']
+        self.limiter = RateLimiter(qps if qps is not None else settings['qps'],
+                                   max_queue if max_queue is not None else settings['max_queue'])
+        self.pool_size = pool_size or settings['pool_size']
+        self.stats = {"requests": 0, "rejected": 0, "expired": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self.server = None
+        self.ocr = None
+
+    def _prepare_ocr(self):
+        """在代理进程中直接调用百度OCR，并按并发数配置连接池"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from .ocr import ocr_manager
+
+        # 代理进程自身必须直接调用百度OCR
+        ocr_manager._ensure_settings()
+        ocr_manager.use_broker = False
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        ocr_manager.session = session
+        return ocr_manager
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def dispatch(self, request):
+        """处理一个请求
+
+        支持的操作:
+            ping: 返回代理状态
+            recognize: {backend, image(base64)} -> {text, confidence}
+        """
+        op = request.get('op')
+        if op == 'ping':
+            return {"ok": True, "pid": os.getpid(), "waiting": self.limiter.waiting, "stats": dict(self.stats)}
+        if op != 'recognize':
+            return {"ok": False, "error": f"未知的操作: {op}"}
+
+        self._count('requests')
+        # 客户端的等待时间，排队结束时客户端已放弃等待的请求不再调用识别接口，避免白白消耗额度
+        timeout = request.get('timeout')
+        expires_at = time.monotonic() + timeout if timeout else None
+        if not self.limiter.acquire():
+            self._count('rejected')
+            return {"ok": False, "code": "busy", "error": "OCR代理排队已满"}
+        if expires_at is not None and time.monotonic() >= expires_at:
+            self._count('expired')
+            return {"ok": False, "error": "请求在排队中已超时"}
+
+        image_bytes = base64.b64decode(request['image'])
+        text, confidence = self.ocr._recognize_with(request.get('backend'), image_bytes)
+        if not text:
+            self._count('failed')
+        return {"ok": True, "text": text, "confidence": confidence}
+
+    def serve_forever(self):
+        """启动代理并阻塞运行，直到收到中断信号"""
+        self.ocr = self._prepare_ocr()
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            if _UnixServer is None:
+                raise BrokerError("当前系统不支持Unix套接字")
+            if os.path.exists(address):
+                os.remove(address)
+            self.server = _UnixServer(address, _BrokerHandler)
+        else:
+            self.server = _TCPServer(address, _BrokerHandler)
+        self.server.broker = self
+
+        logger.info(f"OCR代理已启动: {self.address}，QPS限制: {1 / self.limiter.interval if self.limiter.interval else '不限'}")
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("OCR代理收到中断信号，正在退出")
+        finally:
+            self.server.server_close()
+            if family == socket.AF_UNIX and os.path.exists(address):
+                os.remove(address)
+            logger.info(f"OCR代理已停止，统计: {self.stats}")
+
+class OCRBrokerClient:
+    """OCR代理客户端，每个线程复用一条到代理的长连接"""
+
+    def __init__(self, address, timeout=60):
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self, timeout):
+        family, address = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                self._local.reader.close()
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def call(self, request, timeout=None):
+        """发送一个请求并等待响应
+
+        只有复用的空闲连接在请求送达之前已经失效（发送失败，或代理已关闭连接、读到空响应）时
+        才重连并重发一次，重发只使用剩余的等待时间；等待响应超时或连接在等待中断开时不重发，
+        避免同一张验证码被识别两次。
+
+        Args:
+            request: 请求内容
+            timeout: 本次请求的总等待时间（秒），不超过客户端配置的超时
+
+        Raises:
+            BrokerUnavailable: 无法连接代理，请求没有送达
+            BrokerBusy: 代理排队已满，拒绝了请求
+            BrokerError: 代理返回错误、响应超时或连接在等待响应时断开
+        """
+        budget = self.timeout if timeout is None else min(self.timeout, timeout)
+        expires_at = time.monotonic() + budget
+        payload = dumps(dict(request, timeout=budget)) + b'\n'
+        for attempt in range(2):
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                raise BrokerError(f"等待OCR代理超时（{budget:.1f}秒）")
+            sock = getattr(self._local, 'sock', None)
+            reused = sock is not None
+            try:
+                if sock is None:
+                    sock = self._connect(remaining)
+                sock.settimeout(remaining)
+                sock.sendall(payload)
+            except socket.timeout:
+                self._close()
+                raise BrokerError(f"发送请求到OCR代理超时（{budget:.1f}秒）")
+            except OSError as e:
+                self._close()
+                if reused and attempt == 0:
+                    continue
+                raise BrokerUnavailable(f"无法连接OCR代理 {self.address}: {str(e)}")
+
+            try:
+                line = self._local.reader.readline()
+            except socket.timeout:
+                self._close()
+                raise BrokerError(f"等待OCR代理响应超时（{budget:.1f}秒）")
+            except OSError as e:
+                self._close()
+                raise BrokerError(f"等待OCR代理响应时连接断开: {str(e)}")
+            if not line:
+                self._close()
+                # 空闲连接已被代理关闭，请求没有被处理
+                if reused and attempt == 0:
+                    continue
+                raise BrokerError("OCR代理关闭了连接")
+
+            try:
+                response = loads(line)
+            except ValueError:
+                self._close()
+                raise BrokerError("OCR代理响应格式错误")
+            if not response.get('ok'):
+                if response.get('code') == 'busy':
+                    raise BrokerBusy(response.get('error', 'OCR代理排队已满'))
+                raise BrokerError(response.get('error', '未知错误'))
+            return response
+
+    def ping(self):
+        """检查代理是否可用"""
+        return self.call({"op": "ping"})
+
+    def recognize(self, backend, image_bytes, timeout=None):
+        """通过代理识别验证码
+
+        Args:
+            backend: 识别器
+            image_bytes: 验证码图片
+            timeout: 本次识别的等待时间（秒）
+
+        Returns:
+            tuple: (识别文本, 置信度)
+        """
+        response = self.call({
+            "op": "recognize",
+            "backend": backend,
+            "image": base64.b64encode(image_bytes).decode('ascii')
+        }, timeout)
+        return response.get('text'), response.get('confidence')
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+import heapq
+import random
+from datetime import datetime, timedelta
+from .logger import logger
+from .config_manager import config_manager
+from .history_manager import history_manager
+
+# 没有任何历史耗时数据时使用的默认单账号耗时（秒），按登录方式区分
+DEFAULT_DURATIONS = {"cookie": 5.0, "password": 10.0, "captcha": 20.0}
+# 蒙特卡洛模拟次数
+SIMULATION_RUNS = 200
+
+class RunPlanner:
+    """根据历史签到耗时估算整次运行时间，并推荐并发数和开始时间
+
+    每个账号的耗时从该账号最近的签到记录中抽样；没有记录的账号按全部账号中相同登录方式的耗时抽样。
+    模拟时按调度顺序把账号分配给最先空闲的并发槽位，同时限制每秒开始的账号数，
+    重复多次后取运行总时间的中位数和90分位数。
+    """
+    _instance = None  # 单例模式实例
+
+    def __new__(cls):
+        """实现单例模式"""
+        if cls._instance is None:
+            cls._instance = super(RunPlanner, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化运行规划器"""
+        if self._initialized:
+            return
+
+        self._initialized = True
+
+    def collect_samples(self, usernames, days=30):
+        """收集各账号最近days天的签到耗时
+
+        Returns:
+            tuple: ({用户名: [耗时]}, {登录方式: [耗时]})
+        """
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        months = days // 28 + 2
+        per_account = {}
+        per_path = {}
+        for username in usernames:
+            samples = []
+            for record in history_manager.get_account_records(username, months):
+                if record["date"] < since or record.get("elapsed") is None:
+                    continue
+                samples.append(record["elapsed"])
+                per_path.setdefault(record.get("login_path") or "password", []).append(record["elapsed"])
+            if samples:
+                per_account[username] = samples
+        return per_account, per_path
+
+    def _fallback_samples(self, username, per_path):
+        """没有历史记录的账号使用的耗时样本：有可用Cookie时按Cookie登录估算，否则按账号密码登录估算"""
+        from .scheduler import account_scheduler, DEFAULT_SCHEDULER_CONFIG
+        max_age_days = config_manager.get('scheduler', 'cookie_max_age_days', DEFAULT_SCHEDULER_CONFIG['cookie_max_age_days'])
+        paths = ('cookie',) if account_scheduler.has_valid_cookie(username, max_age_days) else ('captcha', 'password')
+        for path in paths:
+            if per_path.get(path):
+                return per_path[path]
+        samples = [value for values in per_path.values() for value in values]
+        return samples or [DEFAULT_DURATIONS[paths[0]]]
+
+    def simulate(self, samples, concurrency, rate=None, delay=0.0, runs=SIMULATION_RUNS, seed=0):
+        """模拟运行总时间
+
+        Args:
+            samples: 按调度顺序排列的各账号耗时样本列表
+            concurrency: 总并发数（工作进程数×每进程并发数）
+            rate: 每秒最多开始的账号数，None表示不限制
+            delay: 顺序签到时账号之间的平均等待时间（秒）
+            runs: 模拟次数
+
+        Returns:
+            dict: {p50, p90, mean}，单位为秒
+        """
+        rng = random.Random(seed)
+        interval = 1.0 / rate if rate else 0.0
+        totals = []
+        for _ in range(runs):
+            slots = [0.0] * max(1, concurrency)
+            next_start = 0.0
+            finish = 0.0
+            for account_samples in samples:
+                free_at = heapq.heappop(slots)
+                start = max(free_at, next_start)
+                next_start = start + interval
+                end = start + rng.choice(account_samples)
+                finish = max(finish, end)
+                heapq.heappush(slots, end + delay)
+            totals.append(finish)
+        totals.sort()
+        return {
+            "p50": round(totals[len(totals) // 2], 1),
+            "p90": round(totals[min(len(totals) - 1, int(len(totals) * 0.9))], 1),
+            "mean": round(sum(totals) / len(totals), 1)
+        }
+
+    def _serial_delay(self):
+        """顺序签到时账号之间的平均等待时间"""
+        account_delay = config_manager.get('sign', 'account_delay', {})
+        return (account_delay.get('min', 5) + account_delay.get('max', 10)) / 2
+
+    def _prepare(self, usernames, days):
+        """按调度顺序整理各账号的耗时样本"""
+        per_account, per_path = self.collect_samples(usernames, days)
+        samples = [per_account.get(username) or self._fallback_samples(username, per_path) for username in usernames]
+        return samples, len(per_account)
+
+    def _forecast_samples(self, samples, concurrency, rate):
+        # 顺序签到时账号之间有随机延迟，并发签到时没有
+        delay = self._serial_delay() if concurrency <= 1 else 0.0
+        result = self.simulate(samples, concurrency, rate, delay)
+        result['concurrency'] = concurrency
+        return result
+
+    def forecast(self, usernames, concurrency, rate=None, days=30):
+        """估算给定并发数下的运行时间"""
+        samples, with_history = self._prepare(usernames, days)
+        result = self._forecast_samples(samples, concurrency, rate)
+        result.update(accounts=len(usernames), with_history=with_history)
+        return result
+
+    def max_concurrency(self):
+        """配置允许的总并发数（parallel.workers×parallel.concurrency）"""
+        workers = config_manager.get('parallel', 'workers', 1)
+        concurrency = config_manager.get('parallel', 'concurrency', 1)
+        return max(1, workers) * max(1, concurrency)
+
+    def recommend(self, usernames, target_seconds, rate=None, max_concurrency=None, days=30):
+        """二分查找90分位运行时间不超过目标的最小并发数
+
+        Args:
+            max_concurrency: 并发数上限，默认为配置允许的总并发数
+
+        Returns:
+            dict: 该并发数下的估算结果，met表示是否能达到目标
+        """
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrency()
+        samples, with_history = self._prepare(usernames, days)
+        low, high = 1, max(1, min(max_concurrency, len(usernames)))
+        best = self._forecast_samples(samples, high, rate)
+        best['met'] = best['p90'] <= target_seconds
+        if best['met']:
+            while low < high:
+                middle = (low + high) // 2
+                result = self._forecast_samples(samples, middle, rate)
+                if result['p90'] <= target_seconds:
+                    best, high = result, middle
+                    best['met'] = True
+                else:
+                    low = middle + 1
+        best.update(accounts=len(usernames), with_history=with_history, max_concurrency=max_concurrency)
+        return best
+
+    @staticmethod
+    def finish_time(finish_by):
+        """把HH:MM换算为下一个该时刻，今天已过时为明天"""
+        hour, minute = (int(part) for part in finish_by.split(':'))
+        now = datetime.now()
+        finish = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if finish <= now:
+            finish += timedelta(days=1)
+        return finish
+
+    def plan(self, usernames, concurrency=None, rate=None, target_minutes=None, finish_by=None, days=30):
+        """生成运行计划
+
+        Args:
+            usernames: 按调度顺序排列的账号
+            concurrency: 指定并发数时只做估算
+            rate: 每秒最多开始的账号数
+            target_minutes: 目标运行时长（分钟）
+            finish_by: 目标完成时间 HH:MM，会换算为开始时间；未指定目标时长时，
+                以从现在到完成时间的时长为目标
+        """
+        finish = self.finish_time(finish_by) if finish_by else None
+        if concurrency:
+            result = self.forecast(usernames, concurrency, rate, days)
+        else:
+            target = target_minutes * 60 if target_minutes else None
+            if finish is not None and target is None:
+                target = (finish - datetime.now()).total_seconds()
+            if target:
+                result = self.recommend(usernames, target, rate, days=days)
+                result['target'] = target
+            else:
+                result = self.forecast(usernames, 1, rate, days)
+
+        if finish is not None:
+            result['start_at'] = (finish - timedelta(seconds=result['p90'])).strftime("%Y-%m-%d %H:%M")
+        return result
+
+    def report(self, forecast, actual_seconds):
+        """运行结束后对比预测和实际耗时"""
+        if not forecast:
+            return None
+        error = (actual_seconds - forecast['p50']) / forecast['p50'] if forecast['p50'] else None
+        logger.info(f"运行耗时预测: 中位数 {forecast['p50']:.1f}秒 / 90分位 {forecast['p90']:.1f}秒，"
+                    f"实际 {actual_seconds:.1f}秒" + (f"，偏差 {error:+.0%}" if error is not None else ""))
+        return {
+            "forecast_p50": forecast['p50'],
+            "forecast_p90": forecast['p90'],
+            "forecast_error": round(error, 3) if error is not None else None
+        }
+
+# 创建全局运行规划器实例
+run_planner = RunPlanner()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import sys
+from datetime import datetime
+from contextlib import contextmanager
+
+from .logger import logger
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，无法获取峰值内存
+    resource = None
+
+def _frame_name(func):
+    """把pstats的函数键转换为火焰图中的帧名称"""
+    filename, lineno, funcname = func
+    name = f"{os.path.basename(filename)}:{lineno}({funcname})" if lineno else funcname
+    # 分号是折叠栈格式的分隔符，空格是栈与计数的分隔符
+    return re.sub(r'[;\s]', '_', name)
+
+def _safe_name(name):
+    """把账号名转换为可用作文件名的字符串"""
+    return re.sub(r'[\\/:*?"<>|\s]', '_', str(name))
+
+def peak_rss_mb(children=False):
+    """进程的峰值常驻内存（MiB），无法获取时返回None
+
+    Args:
+        children: 为True时返回已结束的子进程（如工作进程）中最大的峰值
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # macOS上ru_maxrss的单位是字节，Linux上是KiB
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss / divisor, 1) if usage.ru_maxrss else None
+
+def stats_to_collapsed(stats, max_depth=64, min_us=1):
+    """把pstats统计数据转换为折叠栈格式（flamegraph.pl / speedscope 可直接读取）
+
+    cProfile只记录调用者与被调用者之间的边，这里按每条边的累计耗时占比把
+    函数的自身耗时分摊到各条调用路径上，得到近似的完整调用栈。
+
+    Args:
+        stats: pstats.Stats对象
+        max_depth: 最大栈深度
+        min_us: 低于该值（微秒）的路径不输出
+
+    Returns:
+        list: 折叠栈文本行，格式为 "帧1;帧2;帧3 微秒数"
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    totals = {}
+
+    def walk(func, stack, fraction):
+        _, _, self_time, cum_time, _ = raw[func]
+        value = int(self_time * fraction * 1e6)
+        if value >= min_us:
+            key = ';'.join(_frame_name(f) for f in stack)
+            totals[key] = totals.get(key, 0) + value
+        if len(stack) >= max_depth:
+            return
+        for callee, edge_time in callees.get(func, []):
+            callee_total = raw[callee][3]
+            if callee in stack or callee_total <= 0:
+                continue
+            share = fraction * edge_time / callee_total
+            if share * callee_total * 1e6 < min_us:
+                continue
+            walk(callee, stack + [callee], share)
+
+    roots = [func for func, value in raw.items() if not value[4]]
+    for root in roots:
+        walk(root, [root], 1.0)
+    return [f"{stack} {value}" for stack, value in sorted(totals.items())]
+
+def _merge_collapsed(collapsed, root, stats):
+    """把一组统计数据的折叠栈加上根帧后合并到结果字典"""
+    for line in stats_to_collapsed(stats):
+        stack, value = line.rsplit(' ', 1)
+        key = f"{root};{stack}"
+        collapsed[key] = collapsed.get(key, 0) + int(value)
+
+class ProfileManager:
+    """性能分析管理类，按签到阶段采集cProfile数据并可选采集tracemalloc快照"""
+    _instance = None  # 单例模式实例
+
+    def __new__(cls):
+        """实现单例模式"""
+        if cls._instance is None:
+            cls._instance = super(ProfileManager, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化性能分析管理器"""
+        if self._initialized:
+            return
+
+        self.enabled = False
+        self.memory = False
+        self.output_dir = None
+        self._run_profile = None     # 不属于任何阶段的耗时
+        self._phase_profiles = {}    # (账号, 阶段) -> cProfile.Profile
+        self._stack = []             # 当前正在采集的Profile栈，只有栈顶处于启用状态
+        self._baseline_snapshot = None
+        self._initialized = True
+
+    def enable(self, output_dir='profiles', memory=False):
+        """启用性能分析
+
+        Args:
+            output_dir: 输出根目录，每次运行会在其中创建以时间命名的子目录
+            memory: 是否在每个账号前后采集tracemalloc快照
+        """
+        self.enabled = True
+        self.memory = memory
+        self.output_dir = os.path.join(output_dir, datetime.now().strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(self.output_dir, exist_ok=True)
+        logger.info(f"性能分析已启用，输出目录: {self.output_dir}")
+
+    def start_run(self):
+        """开始采集整次运行"""
+        if not self.enabled:
+            return
+        # cProfile/pstats/tracemalloc导入较慢，只在启用性能分析时导入
+        import cProfile
+        import tracemalloc
+        if self.memory:
+            tracemalloc.start(25)
+            self._baseline_snapshot = tracemalloc.take_snapshot()
+        self._run_profile = cProfile.Profile()
+        self._push(self._run_profile)
+
+    def _push(self, profile):
+        if self._stack:
+            self._stack[-1].disable()
+        self._stack.append(profile)
+        profile.enable()
+
+    def _pop(self):
+        profile = self._stack.pop()
+        profile.disable()
+        if self._stack:
+            self._stack[-1].enable()
+
+    @contextmanager
+    def phase(self, account, name):
+        """采集一个签到阶段，嵌套阶段的耗时只计入最内层阶段"""
+        if not self.enabled or self._run_profile is None:
+            yield
+            return
+        key = (account, name)
+        profile = self._phase_profiles.get(key)
+        if profile is None:
+            import cProfile
+            profile = self._phase_profiles[key] = cProfile.Profile()
+        self._push(profile)
+        try:
+            yield
+        finally:
+            self._pop()
+
+    @contextmanager
+    def account(self, account):
+        """采集单个账号前后的内存快照"""
+        if not self.enabled or not self.memory:
+            yield
+            return
+        import tracemalloc
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            self._write_memory_report(account, before, after)
+
+    def _write_memory_report(self, account, before, after, limit=30):
+        """写出单个账号的内存变化和相对运行开始时的累计驻留"""
+        import tracemalloc
+        try:
+            memory_dir = os.path.join(self.output_dir, 'memory')
+            os.makedirs(memory_dir, exist_ok=True)
+            current, peak = tracemalloc.get_traced_memory()
+            path = os.path.join(memory_dir, f'{_safe_name(account)}.txt')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"当前已分配: {current / 1024:.1f} KiB，峰值: {peak / 1024:.1f} KiB\n\n")
+                f.write(f"== 本账号前后的分配变化 (前{limit}项) ==\n")
+                for stat in after.compare_to(before, 'lineno')[:limit]:
+                    f.write(f"{stat}\n")
+                f.write(f"\n== 相对运行开始的累计驻留 (前{limit}项) ==\n")
+                for stat in after.compare_to(self._baseline_snapshot, 'traceback')[:limit]:
+                    f.write(f"{stat}\n")
+                    for line in stat.traceback.format(limit=5):
+                        f.write(f"    {line}\n")
+        except Exception as e:
+            logger.error(f"写入内存分析报告失败: {str(e)}")
+
+    def finish_run(self):
+        """结束采集并写出pstats文件和折叠栈文件"""
+        if not self.enabled or self._run_profile is None:
+            return None
+        import pstats
+        import tracemalloc
+        while self._stack:
+            self._pop()
+        try:
+            run_stats = pstats.Stats(self._run_profile)
+            # 折叠栈以阶段名作为根帧，同一阶段在各账号间的耗时合并
+            collapsed = {}
+            _merge_collapsed(collapsed, 'run', run_stats)
+            for (account, name), profile in self._phase_profiles.items():
+                phase_path = os.path.join(self.output_dir, f'{_safe_name(account)}.{name}.pstats')
+                profile.dump_stats(phase_path)
+                phase_stats = pstats.Stats(profile)
+                _merge_collapsed(collapsed, name, phase_stats)
+                run_stats.add(phase_stats)
+
+            run_path = os.path.join(self.output_dir, 'run.pstats')
+            run_stats.dump_stats(run_path)
+            with open(os.path.join(self.output_dir, 'run.collapsed'), 'w', encoding='utf-8') as f:
+                for stack, value in sorted(collapsed.items()):
+                    f.write(f"{stack} {value}\n")
+            logger.info(f"性能分析结果已写入: {self.output_dir}")
+            return self.output_dir
+        except Exception as e:
+            logger.error(f"写入性能分析结果失败: {str(e)}")
+            return None
+        finally:
+            self._run_profile = None
+            self._phase_profiles = {}
+            if self.memory and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+# 创建全局性能分析管理器实例
+profiler = ProfileManager()
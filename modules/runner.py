@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+from .logger import logger
+from .history_manager import history_manager
+from .profiler import profiler
+from .event_log import event_log
+from .deadline import Deadline
+
+def sign_account(account, deadline):
+    """执行单个账号的签到
+
+    Args:
+        account: 账号信息字典
+        deadline: 该账号的时间预算
+
+    Returns:
+        dict: 签到结果，status为 success/failed/timeout/error
+    """
+    # 签到模块依赖requests等较重的库，仅在真正执行签到时导入
+    from .signer import DzSigner
+
+    username = account.get('username')
+    result = {'username': username, 'status': 'failed', 'reward': 0, 'failure_reason': None}
+    try:
+        # 已超过整次运行的截止时间，直接记录为超时
+        if deadline.expired():
+            logger.error(f"已超过运行截止时间，账号 {username} 未执行签到")
+            history_manager.add_sign_record(username, {'status': 'timeout'})
+            event_log.emit(username, 'run', 'timeout', error='DeadlineExceeded')
+            result['status'] = 'timeout'
+            return result
+
+        signer = DzSigner(username, account.get('password'), account.get('questionid', 0),
+                          account.get('answer', ""), deadline=deadline)
+        with profiler.account(username):
+            success = signer.run()
+
+        if success:
+            result['status'] = 'success'
+            # 从最新的签到记录中提取积分奖励
+            latest_record = history_manager.get_latest_record(username)
+            if latest_record:
+                result['reward'] = latest_record.get('reward', 0)
+        elif signer.deadline.expired():
+            result['status'] = 'timeout'
+        result['failure_reason'] = signer.failure_reason
+    except Exception as e:
+        logger.error(f"处理账号 {username} 时出现未捕获的异常: {str(e)}")
+        event_log.emit(username, 'run', 'error', error=type(e).__name__)
+        result['status'] = 'error'
+    return result
+
+def _sign_chunk(accounts, concurrency, account_timeout, run_remaining):
+    """工作进程入口：用线程池签到一组账号
+
+    签到记录只在本进程内暂存，连同结果一起返回给主进程统一写入历史记录，
+    避免多个进程同时写历史文件。
+
+    Returns:
+        tuple: (结果列表, [(用户名, 签到记录)])
+    """
+    from .ocr import ocr_manager
+    # 识别线程池按本进程的并发签到数创建
+    ocr_manager.concurrency = concurrency
+    run_deadline = Deadline(run_remaining)
+    history_manager.start_collecting()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='signer') as executor:
+            results = list(executor.map(
+                lambda account: sign_account(account, Deadline(account_timeout, parent=run_deadline)),
+                accounts
+            ))
+    finally:
+        records = history_manager.stop_collecting()
+        # 工作进程退出时不一定执行atexit，主动写出缓冲的事件
+        event_log.flush()
+    return results, records
+
+def run_parallel(accounts, workers, concurrency, account_timeout, run_deadline):
+    """把账号分配到多个工作进程并发签到
+
+    Args:
+        accounts: 待签到的账号列表
+        workers: 工作进程数，为1时在当前进程内用线程池执行
+        concurrency: 每个工作进程内的并发签到数
+        account_timeout: 单账号时间预算（秒）
+        run_deadline: 整次运行的时间预算
+
+    Returns:
+        list: 所有账号的签到结果
+    """
+    remaining = run_deadline.remaining()
+    # 传给工作进程的是剩余秒数，已耗尽时传一个极小值而不是0（0表示不限制）
+    run_remaining = None if remaining is None else max(remaining, 0.001)
+
+    if workers <= 1:
+        results, records = _sign_chunk(accounts, concurrency, account_timeout, run_remaining)
+        history_manager.merge_records(records)
+        return results
+
+    # 按轮询方式分组，使各进程的账号数量均衡
+    chunks = [accounts[i::workers] for i in range(workers) if accounts[i::workers]]
+    logger.info(f"使用 {len(chunks)} 个工作进程，每个进程并发 {concurrency} 个账号")
+    results = []
+    with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+        futures = {
+            executor.submit(_sign_chunk, chunk, concurrency, account_timeout, run_remaining): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(futures):
+            try:
+                chunk_results, records = future.result()
+            except Exception as e:
+                logger.error(f"工作进程执行失败: {str(e)}")
+                chunk_results = [{'username': account.get('username'), 'status': 'error',
+                                  'reward': 0, 'failure_reason': None} for account in futures[future]]
+                records = []
+            # 每个进程完成后立即合并，主进程是唯一写历史文件的地方
+            history_manager.merge_records(records)
+            results.extend(chunk_results)
+    return results
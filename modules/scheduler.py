@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import os
+import math
+import time
+from datetime import datetime, timedelta
+from .logger import logger
+from .config_manager import config_manager
+from .history_manager import history_manager
+
+# 默认调度参数
+DEFAULT_SCHEDULER_CONFIG = {
+    "strategy": "priority",    # priority: 按优先级排序；file: 保持账号文件中的顺序
+    "cookie_cost": 1,          # 有可用Cookie时的相对登录成本
+    "login_cost": 4,           # 需要账号密码（可能还有验证码）登录时的相对成本
+    "cookie_max_age_days": 30, # 超过该天数的Cookie视为失效
+    "failure_window_days": 30  # 统计失败率的天数
+}
+
+class AccountScheduler:
+    """签到顺序调度，在运行时间有限时优先完成价值最高的签到
+
+    每个账号的优先级为 期望价值 / 期望成本：
+    - 价值：连续签到天数越长，中断的损失越大（按对数增长）；今天已签到的账号价值最低
+    - 成功概率：按最近的签到记录计算失败率
+    - 成本：有可用Cookie的账号无需登录和识别验证码，成本较低
+    """
+    _instance = None  # 单例模式实例
+
+    def __new__(cls):
+        """实现单例模式"""
+        if cls._instance is None:
+            cls._instance = super(AccountScheduler, cls).__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        """初始化调度器"""
+        if self._initialized:
+            return
+
+        self._initialized = True
+
+    def _settings(self):
+        """读取调度配置，未配置的项使用默认值"""
+        settings = dict(DEFAULT_SCHEDULER_CONFIG)
+        settings.update(config_manager.get_config().get('scheduler', {}))
+        return settings
+
+    def has_valid_cookie(self, username, max_age_days):
+        """判断账号是否有未过期的Cookie文件"""
+        cookies_dir = config_manager.get('paths', 'cookies_dir', 'cookies')
+        cookie_file = f'{cookies_dir}/{username}_cookies.json'
+        try:
+            return time.time() - os.path.getmtime(cookie_file) < max_age_days * 86400
+        except OSError:
+            return False
+
+    def failure_rate(self, username, window_days):
+        """最近window_days天签到记录中未成功的比例，没有记录时返回0"""
+        since = (datetime.now() - timedelta(days=window_days)).strftime("%Y-%m-%d")
+        # 只加载覆盖统计窗口的最近几个月分区
+        months = window_days // 28 + 2
+        records = [record for record in history_manager.get_account_records(username, months)
+                   if record["date"] >= since]
+        if not records:
+            return 0.0
+        failures = sum(1 for record in records if record.get("status") != "success")
+        return failures / len(records)
+
+    def score(self, account, settings=None):
+        """计算账号的调度优先级
+
+        Returns:
+            dict: {username, streak_at_risk, signed_today, failure_rate, cookie, priority}
+        """
+        settings = settings or self._settings()
+        username = account['username']
+        today = datetime.now().strftime("%Y-%m-%d")
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+
+        header = history_manager.history_data["accounts"].get(username) or {}
+        # 旧版索引没有last_success，连续签到天数不为0时last_sign即为最近一次成功的日期
+        last_success = header.get("last_success",
+                                  header.get("last_sign", "") if header.get("consecutive_days") else "")
+        signed_today = last_success == today
+        # 只有昨天签到成功的账号今天才有连续签到可以保住
+        streak_at_risk = header.get("consecutive_days", 0) if last_success == yesterday else 0
+
+        failure_rate = self.failure_rate(username, settings['failure_window_days'])
+        cookie = self.has_valid_cookie(username, settings['cookie_max_age_days'])
+        cost = settings['cookie_cost'] if cookie else settings['login_cost']
+
+        value = 0.1 if signed_today else 1 + math.log1p(streak_at_risk)
+        # 失败率为1的账号仍保留很小的概率，保证排在最后而不是被丢弃
+        priority = value * max(1 - failure_rate, 0.05) / cost
+        return {
+            "username": username,
+            "streak_at_risk": streak_at_risk,
+            "signed_today": signed_today,
+            "failure_rate": round(failure_rate, 3),
+            "cookie": cookie,
+            "priority": round(priority, 4)
+        }
+
+    def order(self, accounts):
+        """按优先级从高到低排列账号，优先级相同时保持原顺序"""
+        settings = self._settings()
+        if settings['strategy'] != 'priority' or len(accounts) < 2:
+            return list(accounts)
+
+        scores = {}
+        for account in accounts:
+            try:
+                scores[account['username']] = self.score(account, settings)
+            except Exception as e:
+                logger.warning(f"计算账号 {account['username']} 的调度优先级失败: {str(e)}")
+                scores[account['username']] = {"priority": 0}
+
+        ordered = sorted(accounts, key=lambda account: -scores[account['username']]['priority'])
+        for index, account in enumerate(ordered[:5]):
+            info = scores[account['username']]
+            logger.info(f"调度顺序 {index+1}: {account['username']} (优先级: {info['priority']}，"
+                        f"待保连续签到: {info.get('streak_at_risk', 0)} 天，失败率: {info.get('failure_rate', 0):.0%}，"
+                        f"Cookie: {'有' if info.get('cookie') else '无'})")
+        return ordered
+
+# 创建全局调度器实例
+account_scheduler = AccountScheduler()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""统一的JSON序列化
+
+安装了orjson时使用orjson编解码，否则回退到标准库json。磁盘上的状态文件默认紧凑编码，
+需要人工阅读时可开启storage.pretty；配置文件和账号文件等需要手工编辑的文件始终缩进输出。
+所有文件都先写入同目录下的临时文件再替换，写入过程中断不会留下残缺的文件。
+"""
+import os
+import gzip
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 当前使用的编解码后端
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+def dumps(obj, pretty=False):
+    """编码为UTF-8字节串
+
+    Args:
+        obj: 要编码的对象
+        pretty: 是否缩进输出；缩进输出统一使用标准库，保证手工编辑的文件格式稳定
+    """
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=4).encode('utf-8')
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def loads(data):
+    """解码JSON字节串或字符串"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_line(obj):
+    """编码为JSON Lines中的一行（str，不含换行符）"""
+    return dumps(obj).decode('utf-8')
+
+def _default_pretty():
+    """未指定pretty时读取配置storage.pretty"""
+    # 配置管理器本身也使用该模块，在函数内导入以避免循环导入
+    from .config_manager import config_manager
+    return config_manager.get('storage', 'pretty', False)
+
+def read_json(path):
+    """读取JSON文件，.gz结尾的文件按gzip解压"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return loads(f.read())
+
+def _create_temp(path):
+    """在目标文件同目录下新建临时文件
+
+    以0o666创建，由内核按umask设置权限，与open()新建文件一致
+
+    Returns:
+        tuple: (文件描述符, 临时文件路径)
+    """
+    directory = os.path.dirname(path) or '.'
+    prefix = os.path.join(directory, f'.{os.path.basename(path)}.')
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        temp_path = f'{prefix}{os.urandom(6).hex()}.tmp'
+        try:
+            return os.open(temp_path, flags, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+def write_json(path, obj, pretty=None):
+    """原子写入JSON文件：先写同目录下的临时文件，再替换目标文件
+
+    Args:
+        path: 目标文件路径，.gz结尾时gzip压缩
+        obj: 要写入的对象
+        pretty: 是否缩进输出，None表示读取配置storage.pretty
+    """
+    if pretty is None:
+        pretty = _default_pretty()
+    data = dumps(obj, pretty=pretty)
+    if path.endswith('.gz'):
+        data = gzip.compress(data)
+
+    fd, temp_path = _create_temp(path)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        # 替换已有文件时保留原文件权限
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
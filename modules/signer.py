@@ -2,21 +2,121 @@
 import os
 import re
 import time
-import json
 import random
+from contextlib import contextmanager
 from datetime import datetime
 import requests
-from bs4 import BeautifulSoup
 from requests.exceptions import RequestException, Timeout, ConnectionError
 
 from .logger import logger
 from .config_manager import config_manager
+from .serializer import read_json, write_json
 from .history_manager import history_manager
 from .ocr import ocr_manager
+from .captcha_telemetry import captcha_telemetry
+from .event_log import event_log
+from .http_recorder import http_recorder, read_capped, abort_response, DEFAULT_MAX_RESPONSE_BYTES
+from .deadline import Deadline, DeadlineExceeded, Watchdog
+from .profiler import profiler
+from .tasks import run_tasks
+
+def parse_html(text):
+    """解析HTML页面，BeautifulSoup在首次解析时才导入"""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(text, 'html.parser')
+
+def is_signed_page(text):
+    """根据签到页面内容判断今日是否已签到"""
+    soup = parse_html(text)
+    try:
+        if soup.find('span', {'class': 'btnvisted'}):
+            return True
+            
+        sign_button = soup.find('a', {'id': 'JD_sign'})
+        if not sign_button or 'disabled' in sign_button.get('class', []):
+            return True
+            
+        return "今日已签" in text
+    finally:
+        # 解析树中存在大量循环引用，提取完成后立即拆除，不必等待垃圾回收
+        soup.decompose()
+
+# 签到接口返回内容的关键字，按优先级匹配
+SIGN_RESPONSE_PATTERNS = [
+    ('signed', ('今日已签', '已经签到', '已签到')),
+    ('success', ('签到成功', '恭喜')),
+    ('error', ('来路不明', 'formhash', '非法', '请先登录', '需要先登录', '没有权限', '错误', '失败')),
+]
+
+def parse_sign_response(text):
+    """解析签到接口的AJAX响应
+    
+    Args:
+        text: 响应内容，可能是Discuz的XML包装(CDATA)或纯文本
+        
+    Returns:
+        tuple: (状态, 消息)，状态为 success/signed/error/unknown
+    """
+    message = text or ''
+    cdata = re.search(r'<!\[CDATA\[(.*?)\]\]>', message, re.S)
+    if cdata:
+        message = cdata.group(1)
+    # 去掉HTML标签和多余空白
+    message = re.sub(r'<[^>]+>', ' ', message)
+    message = re.sub(r'\s+', ' ', message).strip()
+    
+    for status, keywords in SIGN_RESPONSE_PATTERNS:
+        if any(keyword in message for keyword in keywords):
+            return status, message
+    return 'unknown', message
+
+# 签到接口拒绝formhash时的关键字
+FORMHASH_REJECTED_KEYWORDS = ('来路不明', 'formhash', '非法')
+
+def extract_formhash(text):
+    """从页面中提取formhash（隐藏表单字段或链接参数），找不到返回None"""
+    match = re.search(r'name="formhash"\s+value="([a-f0-9]{8})"', text or '')
+    if not match:
+        match = re.search(r'formhash=([a-f0-9]{8})', text or '')
+    return match.group(1) if match else None
+
+# 签到页面中统计数据对应的隐藏字段
+SIGN_STATS_FIELDS = {
+    '连续签到': 'lxdays',
+    '签到等级': 'lxlevel',
+    '积分奖励': 'lxreward',
+    '总天数': 'lxtdays',
+    '签到排名': 'qiandaobtnnum'
+}
+
+def parse_sign_stats(text):
+    """从签到页面中提取签到统计数据，缺失的字段为'N/A'"""
+    soup = parse_html(text)
+    stats = {}
+    # 逐个获取统计数据，避免一个字段出错导致整个统计失败
+    for label, field_id in SIGN_STATS_FIELDS.items():
+        try:
+            field = soup.find('input', {'id': field_id})
+            stats[label] = field['value'] if field and 'value' in field.attrs else 'N/A'
+        except Exception as e:
+            logger.warning(f"获取{label}失败: {str(e)}")
+            stats[label] = 'N/A'
+    soup.decompose()
+    return stats
+
+def find_captcha_src(soup):
+    """从登录页面中查找验证码图片的相对地址，找不到返回None"""
+    captcha_img = soup.find('img', {'src': re.compile(r'misc\.php\?mod=seccode')})
+    return captcha_img['src'] if captcha_img else None
+
+def extract_seccode_src(text):
+    """从验证码更新接口的返回中提取验证码图片地址"""
+    match = re.search(r'misc\.php\?mod=seccode(?:&amp;|&)update=\d+(?:&amp;|&)idhash=\w+', text or '')
+    return match.group(0).replace('&amp;', '&') if match else None
 
 class DzSigner:
     """论坛签到器，负责执行登录和签到操作"""
-    def __init__(self, username, password, questionid=0, answer=""):
+    def __init__(self, username, password, questionid=0, answer="", deadline=None):
         self.username = username
         self.password = password
         self.questionid = questionid  # 安全提问ID
@@ -27,14 +127,25 @@ class DzSigner:
             'Origin': 'https://bbs.binmt.cc',
             'Referer': 'https://bbs.binmt.cc/'
         })
+        # 录制或回放模式下挂载对应的适配器，录制时同样限制响应体大小
+        self.max_response_bytes = config_manager.get('request', 'max_response_bytes', DEFAULT_MAX_RESPONSE_BYTES)
+        http_recorder.mount(self.session, self.max_response_bytes, self.username)
+        # 录制时按值脱敏密码和安全提问答案，无论它们以什么字段名提交
+        http_recorder.add_secrets(password, answer)
         
         # 获取配置参数
         cookies_dir = config_manager.get('paths', 'cookies_dir', 'cookies')
         self.cookie_file = f'{cookies_dir}/{username}_cookies.json'
-        self.request_timeout = config_manager.get('request', 'timeout', 30)
+        # 连接超时和读取超时分开配置，兼容旧版的单一timeout配置
+        request_timeout = config_manager.get('request', 'timeout', 30)
+        self.connect_timeout = config_manager.get('request', 'connect_timeout', min(10, request_timeout))
+        self.read_timeout = config_manager.get('request', 'read_timeout', request_timeout)
         self.max_retries = config_manager.get('request', 'max_retries', 3)
         self.retry_delay = config_manager.get('request', 'retry_delay', 3)
         self.captcha_max_attempts = config_manager.get('request', 'captcha_max_attempts', 3)
+        confirm_backoff = config_manager.get('sign', 'confirm_backoff', {})
+        self.confirm_initial_delay = confirm_backoff.get('initial', 0.3)
+        self.confirm_max_attempts = confirm_backoff.get('max_attempts', 3)
         
         # 重试计数器
         self.retry_count = 0
@@ -42,6 +153,66 @@ class DzSigner:
         self.captcha_attempts = 0
         # 签到结果
         self.sign_result = {}
+        # 可分类的失败原因（credential/locked/captcha），供失败缓存使用
+        self.failure_reason = None
+        # 与登录会话绑定的formhash，随Cookie一起保存
+        self.formhash = None
+        # 抓取签到页面时发现今日已签到
+        self.signed_today = False
+        # 各阶段耗时（秒）和登录方式（cookie/password/captcha），随签到记录保存供运行规划使用
+        self.phase_durations = {}
+        self.login_path = None
+        # 正在读取响应体的请求，超出时间预算时由看门狗中断
+        self._active_response = None
+        # 单账号时间预算，未指定时按配置创建
+        if deadline is None:
+            deadline = Deadline(config_manager.get('sign', 'account_timeout', 300))
+        self.deadline = deadline
+
+    def _timeout(self):
+        """计算本次请求的(连接, 读取)超时，不超过剩余时间预算"""
+        self.deadline.check()
+        return (self.deadline.cap(self.connect_timeout), self.deadline.cap(self.read_timeout))
+
+    def _request(self, method, url, **kwargs):
+        """在时间预算内发送请求，响应体不超过字节上限"""
+        response = self.session.request(method, url, timeout=self._timeout(), stream=True, **kwargs)
+        self._active_response = response
+        try:
+            return read_capped(response, self.max_response_bytes, self.deadline)
+        except Exception:
+            # 看门狗中断读取时连接已被关闭，按超出时间预算处理
+            self.deadline.check()
+            raise
+        finally:
+            self._active_response = None
+
+    def _get(self, url, **kwargs):
+        """在时间预算内发送GET请求，响应体不超过字节上限"""
+        return self._request('GET', url, **kwargs)
+
+    def _post(self, url, **kwargs):
+        """在时间预算内发送POST请求，响应体不超过字节上限"""
+        return self._request('POST', url, **kwargs)
+
+    def close(self):
+        """关闭会话，释放连接池和适配器"""
+        self.session.close()
+
+    def _sleep(self, seconds):
+        """在时间预算内等待，预算耗尽时抛出DeadlineExceeded"""
+        self.deadline.sleep(seconds)
+
+    def _on_deadline(self):
+        """看门狗回调：中断正在读取响应体的请求并关闭会话
+
+        仍在等待响应头的请求无法从其他线程中断，其读取超时在发送时已限制在剩余预算内。
+        """
+        logger.warning(f"[{self.username}] 已超出账号时间预算，正在取消进行中的请求")
+        response = self._active_response
+        if response is not None:
+            abort_response(response)
+        self.session.close()
 
     def save_cookies(self):
         """保存Cookie到本地文件"""
@@ -50,8 +221,7 @@ class DzSigner:
             cookies_dir = os.path.dirname(self.cookie_file)
             os.makedirs(cookies_dir, exist_ok=True)
             
-            with open(self.cookie_file, 'w', encoding='utf-8') as f:
-                json.dump(self.session.cookies.get_dict(), f)
+            write_json(self.cookie_file, {'cookies': self.session.cookies.get_dict(), 'formhash': self.formhash})
             logger.info(f"[{self.username}] Cookie已保存到本地: {self.cookie_file}")
             return True
         except Exception as e:
@@ -65,8 +235,14 @@ class DzSigner:
                 logger.info(f"[{self.username}] 未找到Cookie文件，将进行账号登录")
                 return False
                 
-            with open(self.cookie_file, 'r', encoding='utf-8') as f:
-                cookies = json.load(f)
+            data = read_json(self.cookie_file)
+            
+            # 兼容旧版只保存Cookie字典的格式
+            if isinstance(data.get('cookies'), dict):
+                cookies = data['cookies']
+                self.formhash = data.get('formhash')
+            else:
+                cookies = data
                 
             for key, value in cookies.items():
                 self.session.cookies.set(key, value)
@@ -80,14 +256,23 @@ class DzSigner:
     def check_login_status(self):
         """检查登录状态"""
         try:
-            home_page = self.session.get('https://bbs.binmt.cc/', timeout=self.request_timeout)
-            return '访问我的空间' in home_page.text and self.username in home_page.text
+            home_page = self._get('https://bbs.binmt.cc/')
+            logged_in = '访问我的空间' in home_page.text and self.username in home_page.text
+            if logged_in:
+                # 首页中包含当前会话的formhash，顺便更新缓存
+                formhash = extract_formhash(home_page.text)
+                if formhash and formhash != self.formhash:
+                    self.formhash = formhash
+                    self.save_cookies()
+            return logged_in
         except Timeout:
             logger.error(f"[{self.username}] 检查登录状态超时")
             return False
         except ConnectionError:
             logger.error(f"[{self.username}] 检查登录状态连接错误")
             return False
+        except DeadlineExceeded:
+            raise
         except Exception as e:
             logger.error(f"[{self.username}] 检查登录状态失败: {str(e)}")
             return False
@@ -96,22 +281,15 @@ class DzSigner:
         """检测今日是否已签到"""
         for attempt in range(self.max_retries):
             try:
-                sign_page = self.session.get('https://bbs.binmt.cc/k_misign-sign.html', timeout=self.request_timeout)
-                soup = BeautifulSoup(sign_page.text, 'html.parser')
-                
-                if soup.find('span', {'class': 'btnvisted'}):
-                    return True
-                    
-                sign_button = soup.find('a', {'id': 'JD_sign'})
-                if not sign_button or 'disabled' in sign_button.get('class', []):
-                    return True
-                    
-                return "今日已签" in sign_page.text
+                sign_page = self._get('https://bbs.binmt.cc/k_misign-sign.html')
+                return is_signed_page(sign_page.text)
                 
             except Timeout:
                 logger.warning(f"[{self.username}] 签到状态检测超时，第{attempt+1}次尝试")
             except ConnectionError:
                 logger.warning(f"[{self.username}] 签到状态检测连接错误，第{attempt+1}次尝试")
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 logger.error(f"[{self.username}] 签到状态检测失败: {str(e)}")
                 return False
@@ -120,31 +298,59 @@ class DzSigner:
             if attempt < self.max_retries - 1:
                 retry_delay = self.retry_delay + random.uniform(0, 2)  # 添加随机延迟
                 logger.info(f"[{self.username}] {retry_delay:.2f}秒后重试...")
-                time.sleep(retry_delay)
+                self._sleep(retry_delay)
                 
         logger.error(f"[{self.username}] 签到状态检测失败，已达到最大重试次数")
         return False
 
-    def download_captcha(self, soup):
-        """下载验证码图片并处理安全提问"""
+    def confirm_signed(self):
+        """签到结果不明确时轮询签到页面，使用指数退避的短间隔
+
+        签到页面中包含当前会话的formhash，未签到时顺便更新缓存，重试签到时使用
+        """
+        delay = self.confirm_initial_delay
+        for attempt in range(self.confirm_max_attempts):
+            self._sleep(delay)
+            try:
+                sign_page = self._get('https://bbs.binmt.cc/k_misign-sign.html')
+                if is_signed_page(sign_page.text):
+                    return True
+                formhash = extract_formhash(sign_page.text)
+                if formhash and formhash != self.formhash:
+                    self.formhash = formhash
+                    self.save_cookies()
+            except (Timeout, ConnectionError):
+                logger.warning(f"[{self.username}] 确认签到状态请求失败，第{attempt+1}次尝试")
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.error(f"[{self.username}] 确认签到状态失败: {str(e)}")
+                return False
+            delay *= 2
+        return False
+
+    def download_captcha(self, captcha_src):
+        """下载验证码图片
+        
+        Args:
+            captcha_src: 验证码图片的相对地址，来自登录页面或刷新验证码的返回
+        """
+        if not captcha_src:
+            logger.error(f"[{self.username}] 未找到验证码图片")
+            return None
+            
         for attempt in range(self.max_retries):
             try:
-                # 查找验证码图片元素
-                captcha_img = soup.find('img', {'src': re.compile(r'misc\.php\?mod=seccode')})
-                if not captcha_img:
-                    logger.error(f"[{self.username}] 未找到验证码图片")
-                    return None
-                    
                 # 获取验证码图片URL
-                captcha_url = 'https://bbs.binmt.cc/' + captcha_img['src']
+                captcha_url = 'https://bbs.binmt.cc/' + captcha_src
                 
                 # 下载验证码图片
-                captcha_response = self.session.get(captcha_url, timeout=self.request_timeout)
+                captcha_response = self._get(captcha_url)
                 if captcha_response.status_code != 200:
                     logger.error(f"[{self.username}] 下载验证码图片失败: {captcha_response.status_code}")
                     if attempt < self.max_retries - 1:
                         logger.info(f"[{self.username}] 第{attempt+1}次尝试下载验证码图片...")
-                        time.sleep(self.retry_delay)
+                        self._sleep(self.retry_delay)
                         continue
                     return None
                     
@@ -160,40 +366,78 @@ class DzSigner:
                 logger.warning(f"[{self.username}] 下载验证码图片超时，第{attempt+1}次尝试")
             except ConnectionError:
                 logger.warning(f"[{self.username}] 下载验证码图片连接错误，第{attempt+1}次尝试")
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 logger.error(f"[{self.username}] 下载验证码图片失败: {str(e)}")
                 return None
                 
             # 如果不是最后一次尝试，则等待后重试
             if attempt < self.max_retries - 1:
-                time.sleep(self.retry_delay)
+                self._sleep(self.retry_delay)
                 
         logger.error(f"[{self.username}] 下载验证码图片失败，已达到最大重试次数")
         return None
 
+    def refresh_seccode(self, idhash):
+        """通过Discuz的验证码更新接口换一张验证码，不重新加载登录页
+        
+        Returns:
+            str: 新验证码图片的相对地址
+        """
+        try:
+            res = self._get(
+                f'https://bbs.binmt.cc/misc.php?mod=seccode&action=update&idhash={idhash}'
+                f'&inajax=1&ajaxtarget=seccode_{idhash}'
+            )
+            src = extract_seccode_src(res.text)
+            if src:
+                return src
+            logger.warning(f"[{self.username}] 验证码更新接口未返回图片地址，直接请求新验证码")
+        except (Timeout, ConnectionError):
+            logger.warning(f"[{self.username}] 请求验证码更新接口失败，直接请求新验证码")
+        # Discuz每次请求验证码图片都会生成新的验证码，update参数只用于避免缓存
+        return f'misc.php?mod=seccode&update={random.randint(10000, 99999)}&idhash={idhash}'
+
+    def _next_captcha(self, idhash):
+        """换一张验证码，已达到最大尝试次数时不再刷新"""
+        if self.captcha_attempts >= self.captcha_max_attempts:
+            return None
+        return self.refresh_seccode(idhash)
+
+    def _record_captcha(self, outcome, recognition):
+        """记录一次验证码尝试的结果到遥测文件和事件日志"""
+        captcha_telemetry.record(self.username, self.captcha_attempts, outcome, recognition)
+        recognition = recognition or {}
+        event_log.emit(self.username, 'captcha', outcome, attempt=self.captcha_attempts,
+                       backend=recognition.get('backend'), profile=recognition.get('profile'))
+
     def login(self):
         """执行登录操作"""
         # 先尝试加载Cookie并检查登录状态
         if self.load_cookies() and self.check_login_status():
             logger.info(f"[{self.username}] 使用Cookie登录成功")
+            self.login_path = 'cookie'
             return True
             
         logger.info(f"[{self.username}] Cookie无效或已过期，将使用账号密码登录")
         
-        # 重置验证码尝试次数
+        # 重置验证码尝试次数，验证码重试与网络重试分开计数
         self.captcha_attempts = 0
+        self.login_path = 'password'
         
-        # 登录重试机制
+        # 登录重试机制，只有网络错误和验证码下载失败才会重新加载登录页
         for login_attempt in range(self.max_retries):
             try:
-                login_page = self.session.get('https://bbs.binmt.cc/member.php?mod=logging&action=login', timeout=self.request_timeout)
-                soup = BeautifulSoup(login_page.text, 'html.parser')
+                login_page = self._get('https://bbs.binmt.cc/member.php?mod=logging&action=login')
+                soup = parse_html(login_page.text)
                 
                 username_input = soup.find('input', {'name': 'username'})
                 password_input = soup.find('input', {'name': 'password'})
                 
                 if not username_input or not password_input:
                     logger.error(f"[{self.username}] 找不到登录表单元素")
+                    soup.decompose()
                     return False
 
                 login_data = {
@@ -215,81 +459,114 @@ class DzSigner:
                 login_data[password_input['id']] = self.password
 
                 # 检查是否需要验证码
-                seccode_verify = soup.find('input', {'name': 'seccodeverify'})
-                if seccode_verify:
-                    logger.info(f"[{self.username}] 检测到需要输入验证码 (尝试 {self.captcha_attempts + 1}/{self.captcha_max_attempts})")
+                seccode_input = soup.find('input', {'name': 'seccodeverify'})
+                seccode_verify = seccode_input is not None
+                idhash = seccode_input['id'].replace('seccodeverify_', '') if seccode_verify else None
+                # 第一次使用登录页中的验证码，之后只刷新验证码
+                captcha_src = find_captcha_src(soup) if seccode_verify else None
+                # 登录表单已提取完毕，释放解析树
+                soup.decompose()
+                
+                # 验证码重试循环：验证码错误时保留登录表单和formhash，只换一张验证码
+                while True:
+                    recognition = None
+                    if seccode_verify:
+                        # 超过最大尝试次数
+                        if self.captcha_attempts >= self.captcha_max_attempts:
+                            logger.error(f"[{self.username}] 验证码识别已达到最大尝试次数 {self.captcha_max_attempts}")
+                            self.failure_reason = 'captcha'
+                            return False
+                        
+                        self.captcha_attempts += 1
+                        self.login_path = 'captcha'
+                        logger.info(f"[{self.username}] 检测到需要输入验证码 (尝试 {self.captcha_attempts}/{self.captcha_max_attempts})")
+                        
+                        # 下载验证码图片
+                        captcha_path = self.download_captcha(captcha_src)
+                        if not captcha_path:
+                            break
+                        
+                        # 识别验证码
+                        recognition = ocr_manager.recognize(captcha_path, self.deadline)
+                        captcha_text = recognition['text']
+                        if not captcha_text:
+                            self._record_captcha('unrecognized', recognition)
+                            logger.warning(f"[{self.username}] 验证码识别失败，刷新验证码重试")
+                            captcha_src = self._next_captcha(idhash)
+                            continue
+                            
+                        # 添加验证码到登录数据
+                        login_data['seccodehash'] = idhash
+                        login_data['seccodeverify'] = captcha_text
+
+                    # 发送登录请求
+                    login_res = self._post(
+                        'https://bbs.binmt.cc/member.php?mod=logging&action=login&loginsubmit=yes&infloat=yes&handlekey=login',
+                        data=login_data
+                    )
+
+                    # 记录验证码是否被论坛接受，用于统计各预处理方案的识别率
+                    if seccode_verify:
+                        outcome = 'rejected' if '验证码错误' in login_res.text else 'accepted'
+                        self._record_captcha(outcome, recognition)
+
+                    # 检查登录结果
+                    if '欢迎您回来' in login_res.text:
+                        logger.info(f"[{self.username}] 登录成功")
+                        # 登录页上的formhash属于游客会话，登录后需使用新会话的formhash
+                        self.formhash = extract_formhash(login_res.text)
+                        # 保存Cookie
+                        self.save_cookies()
+                        return True
+                        
+                    # 验证码错误时只换一张验证码，无需再请求首页确认登录状态
+                    if '验证码错误' in login_res.text and seccode_verify:
+                        logger.warning(f"[{self.username}] 验证码识别错误，刷新验证码重试")
+                        captcha_src = self._next_captcha(idhash)
+                        continue
                     
-                    # 超过最大尝试次数
-                    if self.captcha_attempts >= self.captcha_max_attempts:
-                        logger.error(f"[{self.username}] 验证码识别已达到最大尝试次数 {self.captcha_max_attempts}")
+                    # 检查是否是密码错误次数过多被临时锁定
+                    if '次数过多' in login_res.text:
+                        logger.error(f"[{self.username}] 登录失败：密码错误次数过多，账号被暂时锁定")
+                        self.failure_reason = 'locked'
                         return False
                     
-                    self.captcha_attempts += 1
-                    
-                    # 下载验证码图片
-                    captcha_path = self.download_captcha(soup)
-                    if not captcha_path:
-                        if login_attempt < self.max_retries - 1:
-                            logger.warning(f"[{self.username}] 验证码下载失败，{self.retry_delay}秒后重试...")
-                            time.sleep(self.retry_delay)
-                            continue
+                    # 检查是否是密码错误
+                    if '密码错误' in login_res.text:
+                        logger.error(f"[{self.username}] 登录失败：密码错误")
+                        self.failure_reason = 'credential'
                         return False
-                        
-                    # 识别验证码
-                    captcha_text = ocr_manager.recognize_captcha(captcha_path)
-                    if not captcha_text:
-                        if login_attempt < self.max_retries - 1:
-                            logger.warning(f"[{self.username}] 验证码识别失败，{self.retry_delay}秒后重试...")
-                            time.sleep(self.retry_delay)
-                            continue
-                        return False
-                        
-                    # 添加验证码到登录数据
-                    idhash = seccode_verify['id'].replace('seccodeverify_', '')
-                    login_data['seccodehash'] = idhash
-                    login_data['seccodeverify'] = captcha_text
-
-                # 发送登录请求
-                login_res = self.session.post(
-                    'https://bbs.binmt.cc/member.php?mod=logging&action=login&loginsubmit=yes&infloat=yes&handlekey=login',
-                    data=login_data,
-                    timeout=self.request_timeout
-                )
-
-                # 检查登录结果
-                if '欢迎您回来' in login_res.text or self.check_login_status():
-                    logger.info(f"[{self.username}] 登录成功")
-                    # 保存Cookie
-                    self.save_cookies()
-                    return True
                     
-                # 如果登录失败，检查是否是验证码错误
-                if '验证码错误' in login_res.text and seccode_verify:
-                    logger.warning(f"[{self.username}] 验证码识别错误，重新尝试")
-                    # 不递归调用，而是继续循环重试
-                    continue
-                
-                # 检查是否是密码错误
-                if '密码错误' in login_res.text:
-                    logger.error(f"[{self.username}] 登录失败：密码错误")
+                    # 返回内容无法判断结果时，通过首页确认是否已登录
+                    if self.check_login_status():
+                        logger.info(f"[{self.username}] 登录成功")
+                        self.save_cookies()
+                        return True
+                        
+                    logger.error(f"[{self.username}] 登录失败，请检查账号密码")
                     return False
-                    
-                logger.error(f"[{self.username}] 登录失败，请检查账号密码")
-                return False
+                
+                # 验证码下载失败，重新加载登录页
+                logger.warning(f"[{self.username}] 验证码下载失败，将重新加载登录页")
                 
             except Timeout:
                 logger.warning(f"[{self.username}] 登录请求超时，第{login_attempt+1}次尝试")
+                event_log.emit(self.username, 'login', 'retry', attempt=login_attempt + 1, error='Timeout')
             except ConnectionError:
                 logger.warning(f"[{self.username}] 登录连接错误，第{login_attempt+1}次尝试")
+                event_log.emit(self.username, 'login', 'retry', attempt=login_attempt + 1, error='ConnectionError')
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 logger.error(f"[{self.username}] 登录过程出现错误: {str(e)}")
+                event_log.emit(self.username, 'login', 'error', attempt=login_attempt + 1, error=type(e).__name__)
                 return False
                 
             # 如果不是最后一次尝试，则等待后重试
             if login_attempt < self.max_retries - 1:
                 retry_delay = self.retry_delay + random.uniform(0, 2)  # 添加随机延迟
                 logger.info(f"[{self.username}] {retry_delay:.2f}秒后重试登录...")
-                time.sleep(retry_delay)
+                self._sleep(retry_delay)
                 
         logger.error(f"[{self.username}] 登录失败，已达到最大重试次数 {self.max_retries}")
         return False
@@ -298,39 +575,48 @@ class DzSigner:
         """获取动态formhash值"""
         for attempt in range(self.max_retries):
             try:
-                if self.check_signed():
+                sign_page = self._get('https://bbs.binmt.cc/k_misign-sign.html')
+                # 同一页面即可判断是否已签到，无需再单独请求
+                if is_signed_page(sign_page.text):
                     logger.info(f"[{self.username}] 今日已完成签到，无需重复操作")
+                    self.signed_today = True
                     return None
                     
-                sign_page = self.session.get('https://bbs.binmt.cc/k_misign-sign.html', timeout=self.request_timeout)
-                soup = BeautifulSoup(sign_page.text, 'html.parser')
+                soup = parse_html(sign_page.text)
                 sign_button = soup.find('a', {'id': 'JD_sign'})
+                sign_href = sign_button['href'] if sign_button else None
+                soup.decompose()
                 
                 if not sign_button:
                     logger.error(f"[{self.username}] 找不到签到按钮")
                     if attempt < self.max_retries - 1:
                         logger.warning(f"[{self.username}] 第{attempt+1}次尝试获取formhash...")
-                        time.sleep(self.retry_delay)
+                        self._sleep(self.retry_delay)
                         continue
                     return None
                     
-                formhash_match = re.search(r'formhash=([a-f0-9]+)', sign_button['href'])
+                formhash_match = re.search(r'formhash=([a-f0-9]+)', sign_href)
                 if not formhash_match:
                     logger.error(f"[{self.username}] 无法从签到按钮中提取formhash")
                     if attempt < self.max_retries - 1:
                         logger.warning(f"[{self.username}] 第{attempt+1}次尝试获取formhash...")
-                        time.sleep(self.retry_delay)
+                        self._sleep(self.retry_delay)
                         continue
                     return None
                     
                 formhash = formhash_match.group(1)
                 logger.info(f"[{self.username}] 成功获取formhash: {formhash}")
+                # 缓存新的formhash，下次运行可直接签到
+                self.formhash = formhash
+                self.save_cookies()
                 return formhash
                 
             except Timeout:
                 logger.warning(f"[{self.username}] 获取formhash超时，第{attempt+1}次尝试")
             except ConnectionError:
                 logger.warning(f"[{self.username}] 获取formhash连接错误，第{attempt+1}次尝试")
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 logger.error(f"[{self.username}] 获取formhash失败: {str(e)}")
                 return None
@@ -339,45 +625,83 @@ class DzSigner:
             if attempt < self.max_retries - 1:
                 retry_delay = self.retry_delay + random.uniform(0, 2)  # 添加随机延迟
                 logger.info(f"[{self.username}] {retry_delay:.2f}秒后重试获取formhash...")
-                time.sleep(retry_delay)
+                self._sleep(retry_delay)
                 
         logger.error(f"[{self.username}] 获取formhash失败，已达到最大重试次数")
         return None
 
-    def sign(self):
-        """执行签到操作"""
-        if self.check_signed():
-            logger.info(f"[{self.username}] 签到状态检测：今日已签到")
-            return True
-
+    def _scrape_formhash(self):
+        """从签到页面抓取formhash，今日已签到时返回(True, None)
+        
+        Returns:
+            tuple: (是否已签到, formhash)
+        """
+        self.signed_today = False
         formhash = self.get_formhash()
-        if not formhash:
-            return False
+        if self.signed_today:
+            return True, None
+        return False, formhash
+
+    def sign(self):
+        """执行签到操作，优先使用缓存的formhash直接发送签到请求"""
+        formhash = self.formhash
+        cached = formhash is not None
+        if cached:
+            logger.info(f"[{self.username}] 使用缓存的formhash直接签到")
+        else:
+            signed, formhash = self._scrape_formhash()
+            if signed:
+                return True
+            if not formhash:
+                return False
 
         for attempt in range(self.max_retries):
             try:
                 logger.info(f"[{self.username}] 正在执行签到操作 (尝试 {attempt+1}/{self.max_retries})")
-                res = self.session.get(
+                res = self._get(
                     f'https://bbs.binmt.cc/plugin.php?id=k_misign:sign&operation=qiandao&formhash={formhash}&format=empty',
-                    headers={'X-Requested-With': 'XMLHttpRequest'},
-                    timeout=self.request_timeout
+                    headers={'X-Requested-With': 'XMLHttpRequest'}
                 )
                 
                 if res.status_code == 200:
-                    # 等待一段时间，确保签到状态更新
-                    wait_time = 1.5 + random.uniform(0, 1)  # 添加随机延迟
-                    logger.info(f"[{self.username}] 签到请求成功，等待 {wait_time:.2f} 秒后检查签到状态...")
-                    time.sleep(wait_time)
+                    # 直接根据接口返回内容判断签到结果
+                    status, message = parse_sign_response(res.text)
+                    if status == 'success':
+                        logger.info(f"[{self.username}] 签到成功: {message}")
+                        return True
+                    if status == 'signed':
+                        logger.info(f"[{self.username}] 今日已签到: {message}")
+                        return True
+                    if status == 'error':
+                        # 缓存的formhash被拒绝时，回退到重新抓取签到页面
+                        if cached and any(keyword in message for keyword in FORMHASH_REJECTED_KEYWORDS):
+                            logger.warning(f"[{self.username}] 缓存的formhash已失效，重新获取: {message}")
+                            cached = False
+                            self.formhash = None
+                            signed, formhash = self._scrape_formhash()
+                            if signed:
+                                return True
+                            if not formhash:
+                                return False
+                            continue
+                        logger.error(f"[{self.username}] 签到请求被拒绝: {message}")
+                        return False
                     
-                    # 检查签到是否成功
-                    if self.check_signed():
+                    # 返回内容无法判断时，短间隔轮询签到页面确认
+                    logger.info(f"[{self.username}] 签到请求已发送，返回内容无法判断结果，开始确认签到状态...")
+                    if self.confirm_signed():
                         logger.info(f"[{self.username}] 签到成功确认")
                         return True
-                    else:
-                        logger.warning(f"[{self.username}] 签到请求已发送，但签到状态未更新")
-                        if attempt < self.max_retries - 1:
-                            logger.info(f"[{self.username}] 将重试签到操作...")
-                            continue
+                    
+                    logger.warning(f"[{self.username}] 签到请求已发送，但签到状态未更新")
+                    if attempt < self.max_retries - 1:
+                        # 使用确认时从签到页面取得的formhash重试，原formhash可能已失效
+                        if self.formhash and self.formhash != formhash:
+                            logger.info(f"[{self.username}] 使用签到页面中的新formhash重试")
+                            formhash = self.formhash
+                            cached = False
+                        logger.info(f"[{self.username}] 将重试签到操作...")
+                        continue
                 else:
                     logger.error(f"[{self.username}] 签到请求返回状态码: {res.status_code}")
                     if attempt < self.max_retries - 1:
@@ -388,6 +712,8 @@ class DzSigner:
                 logger.warning(f"[{self.username}] 签到请求超时，第{attempt+1}次尝试")
             except ConnectionError:
                 logger.warning(f"[{self.username}] 签到请求连接错误，第{attempt+1}次尝试")
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 logger.error(f"[{self.username}] 签到请求失败: {str(e)}")
                 return False
@@ -396,7 +722,7 @@ class DzSigner:
             if attempt < self.max_retries - 1:
                 retry_delay = self.retry_delay + random.uniform(0, 2)  # 添加随机延迟
                 logger.info(f"[{self.username}] {retry_delay:.2f}秒后重试签到...")
-                time.sleep(retry_delay)
+                self._sleep(retry_delay)
                 
         logger.error(f"[{self.username}] 签到失败，已达到最大重试次数")
         return False
@@ -405,26 +731,8 @@ class DzSigner:
         """获取签到统计数据"""
         for attempt in range(self.max_retries):
             try:
-                sign_page = self.session.get('https://bbs.binmt.cc/k_misign-sign.html', timeout=self.request_timeout)
-                soup = BeautifulSoup(sign_page.text, 'html.parser')
-                
-                stats = {}
-                stats_fields = {
-                    '连续签到': 'lxdays',
-                    '签到等级': 'lxlevel',
-                    '积分奖励': 'lxreward',
-                    '总天数': 'lxtdays',
-                    '签到排名': 'qiandaobtnnum'
-                }
-                
-                # 逐个获取统计数据，避免一个字段出错导致整个统计失败
-                for label, field_id in stats_fields.items():
-                    try:
-                        field = soup.find('input', {'id': field_id})
-                        stats[label] = field['value'] if field and 'value' in field.attrs else 'N/A'
-                    except Exception as e:
-                        logger.warning(f"[{self.username}] 获取{label}失败: {str(e)}")
-                        stats[label] = 'N/A'
+                sign_page = self._get('https://bbs.binmt.cc/k_misign-sign.html')
+                stats = parse_sign_stats(sign_page.text)
                 
                 # 检查是否获取到了所有字段
                 if all(value != 'N/A' for value in stats.values()):
@@ -433,7 +741,7 @@ class DzSigner:
                 logger.warning(f"[{self.username}] 部分统计数据获取失败: {stats}")
                 if attempt < self.max_retries - 1:
                     logger.info(f"[{self.username}] 将重试获取统计数据...")
-                    time.sleep(self.retry_delay)
+                    self._sleep(self.retry_delay)
                     continue
                 return stats
                     
@@ -441,47 +749,77 @@ class DzSigner:
                 logger.warning(f"[{self.username}] 获取统计数据超时，第{attempt+1}次尝试")
             except ConnectionError:
                 logger.warning(f"[{self.username}] 获取统计数据连接错误，第{attempt+1}次尝试")
+            except DeadlineExceeded:
+                raise
             except Exception as e:
                 logger.warning(f"[{self.username}] 获取统计信息失败: {str(e)}")
                 return {}
                 
             # 如果不是最后一次尝试，则等待后重试
             if attempt < self.max_retries - 1:
-                time.sleep(self.retry_delay)
+                self._sleep(self.retry_delay)
                 
         logger.warning(f"[{self.username}] 获取统计数据失败，已达到最大重试次数")
         return {}
 
+    @contextmanager
+    def _phase(self, name):
+        """执行一个签到阶段：采集性能数据、记录事件并统计耗时"""
+        start = time.perf_counter()
+        try:
+            with profiler.phase(self.username, name), event_log.phase(self.username, name) as outcome:
+                yield outcome
+        finally:
+            self.phase_durations[name] = round(time.perf_counter() - start, 3)
+
+    def _with_timing(self, stats, start_time):
+        """在签到记录中附加各阶段耗时、总耗时和登录方式"""
+        stats['durations'] = dict(self.phase_durations)
+        stats['elapsed'] = round(time.time() - start_time, 3)
+        stats['login_path'] = self.login_path
+        return stats
+
     def run(self):
         """主运行流程"""
         current_date = datetime.now().strftime("%Y-%m-%d")
         logger.info(f"[{self.username}] 开始执行MT论坛自动签到 - {current_date}")
         start_time = time.time()
+        watchdog = Watchdog(self.deadline, self._on_deadline).start()
+        # 整个流程的结果，结束时记录到事件日志
+        run_status, run_error = 'failed', None
         
         try:
             # 登录
             logger.info(f"[{self.username}] 正在执行登录...")
-            if not self.login():
+            with self._phase('login') as phase:
+                logged_in = self.login()
+                if not logged_in:
+                    phase.update(status='failed', error=self.failure_reason)
+            if not logged_in:
                 logger.error(f"[{self.username}] 登录失败，请检查账号密码或网络连接")
+                run_error = self.failure_reason
                 return False
             
-            # 检查是否已签到
-            logger.info(f"[{self.username}] 正在检查签到状态...")
-            if self.check_signed():
-                logger.info(f"[{self.username}] 今日已完成签到，无需重复操作")
-            else:
-                # 执行签到
-                logger.info(f"[{self.username}] 正在执行签到...")
-                if not self.sign():
-                    logger.warning(f"[{self.username}] 签到未完成，可能出现异常")
-                    # 添加失败记录
-                    failed_stats = {'status': 'failed'}
-                    history_manager.add_sign_record(self.username, failed_stats)
-                    return False
+            # 执行签到：有缓存的formhash时直接发送签到请求，由接口返回判断是否已签到；
+            # 否则抓取签到页面，同一页面同时用于判断是否已签到和获取formhash
+            logger.info(f"[{self.username}] 正在执行签到...")
+            with self._phase('sign') as phase:
+                sign_ok = self.sign()
+                if not sign_ok:
+                    phase['status'] = 'failed'
+            if not sign_ok:
+                logger.warning(f"[{self.username}] 签到未完成，可能出现异常")
+                # 添加失败记录
+                failed_stats = {'status': 'failed'}
+                history_manager.add_sign_record(self.username, self._with_timing(failed_stats, start_time))
+                return False
                     
             # 获取签到统计信息
             logger.info(f"[{self.username}] === 签到信息 ===")
-            stats = self.get_stats()
+            with self._phase('get_stats') as phase:
+                stats = self.get_stats()
+                if not stats:
+                    phase['status'] = 'failed'
             if stats:
                 # 添加状态标记
                 stats['status'] = 'success'
@@ -496,20 +834,38 @@ class DzSigner:
                 logger.info(f"[{self.username}] {summary_message}")
                 
                 # 添加到历史记录
-                history_manager.add_sign_record(self.username, stats)
+                history_manager.add_sign_record(self.username, self._with_timing(stats, start_time))
+            
+            # 在同一登录会话中执行附加任务，避免其他日常任务再次登录；
+            # 签到已完成，任务出现任何问题都不影响本账号的签到结果
+            try:
+                run_tasks(self)
+            except Exception as e:
+                logger.error(f"[{self.username}] 执行附加任务失败: {str(e)}")
             
             # 计算耗时
             elapsed_time = time.time() - start_time
             logger.info(f"[{self.username}] 签到任务完成，耗时: {elapsed_time:.2f}秒")
+            run_status = 'success'
             return True
                 
+        except DeadlineExceeded:
+            logger.error(f"[{self.username}] 签到超时，已超出时间预算")
+            history_manager.add_sign_record(self.username, self._with_timing({'status': 'timeout'}, start_time))
+            run_status, run_error = 'timeout', 'DeadlineExceeded'
+            return False
         except Exception as e:
             logger.error(f"[{self.username}] 签到过程出现未处理的异常: {str(e)}")
             # 添加异常记录
             error_stats = {'status': 'error', 'message': str(e)}
-            history_manager.add_sign_record(self.username, error_stats)
+            history_manager.add_sign_record(self.username, self._with_timing(error_stats, start_time))
+            run_status, run_error = 'error', type(e).__name__
             return False
         finally:
+            watchdog.stop()
+            # 账号结束后立即关闭会话，并发签到时连接池不随已完成的账号累积
+            self.close()
             # 计算总耗时
             total_time = time.time() - start_time
             logger.info(f"[{self.username}] 签到任务结束，总耗时: {total_time:.2f}秒")
+            event_log.emit(self.username, 'run', run_status, total_time, error=run_error)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import re
+import importlib
+from requests.exceptions import Timeout, ConnectionError
+
+from .logger import logger
+from .config_manager import config_manager
+from .history_manager import history_manager
+from .event_log import event_log
+from .profiler import profiler
+from .deadline import DeadlineExceeded
+
+# 已注册的任务：{任务名: 任务类}
+TASKS = {}
+
+def register_task(cls):
+    """注册任务类的装饰器，任务名取类属性name"""
+    TASKS[cls.name] = cls
+    return cls
+
+def load_task_class(name, options):
+    """按任务名或配置中的class（"模块路径:类名"）获取任务类，找不到时返回None"""
+    class_path = options.get('class')
+    if class_path:
+        module_name, _, class_name = class_path.partition(':')
+        return getattr(importlib.import_module(module_name), class_name)
+    return TASKS.get(name)
+
+class BaseTask:
+    """签到后在同一登录会话中执行的附加任务
+
+    子类设置name并实现run()，通过signer._get/_post发送请求即可复用已登录的会话、
+    超时设置和时间预算。返回的字典会作为任务记录的data保存到历史记录中。
+    """
+    name = None
+    # 同一账号每天只执行一次，当天已成功的任务直接跳过
+    once_per_day = True
+
+    def __init__(self, options=None):
+        self.options = options or {}
+
+    def run(self, signer):
+        """执行任务
+
+        Args:
+            signer: 已登录的DzSigner
+
+        Returns:
+            dict: 任务结果，status为 success/failed/skipped
+        """
+        raise NotImplementedError
+
+@register_task
+class TaskRewardTask(BaseTask):
+    """领取论坛任务奖励：申请可领取的新任务，并领取已完成任务的奖励"""
+    name = 'task_reward'
+
+    def run(self, signer):
+        applied = []
+        if self.options.get('apply_new', True):
+            page = signer._get('https://bbs.binmt.cc/home.php?mod=task&item=new')
+            for task_id in sorted(set(re.findall(r'home\.php\?mod=task&(?:amp;)?do=apply&(?:amp;)?id=(\d+)', page.text))):
+                signer._get(f'https://bbs.binmt.cc/home.php?mod=task&do=apply&id={task_id}')
+                applied.append(int(task_id))
+
+        claimed = []
+        page = signer._get('https://bbs.binmt.cc/home.php?mod=task&item=doing')
+        for task_id in sorted(set(re.findall(r'home\.php\?mod=task&(?:amp;)?do=draw&(?:amp;)?id=(\d+)', page.text))):
+            response = signer._get(f'https://bbs.binmt.cc/home.php?mod=task&do=draw&id={task_id}')
+            if '恭喜' in response.text or '成功' in response.text:
+                claimed.append(int(task_id))
+            else:
+                logger.warning(f"[{signer.username}] 领取任务 {task_id} 奖励失败")
+
+        if applied or claimed:
+            logger.info(f"[{signer.username}] 申请任务: {applied or '无'}，领取奖励: {claimed or '无'}")
+        return {"status": "success", "applied": applied, "claimed": claimed}
+
+@register_task
+class CreditTask(BaseTask):
+    """读取积分页面，记录各项积分"""
+    name = 'credit'
+
+    def run(self, signer):
+        page = signer._get('https://bbs.binmt.cc/home.php?mod=spacecp&ac=credit&showcredit=1')
+        # Discuz积分页面格式：<li><em> 金币: </em>123 </li>
+        credits = {
+            label.strip(): int(value)
+            for label, value in re.findall(r'<em>\s*([^<:：]+?)\s*[:：]\s*</em>\s*(-?\d+)', page.text)
+        }
+        if not credits:
+            logger.warning(f"[{signer.username}] 未能从积分页面读取积分")
+            return {"status": "failed"}
+        logger.info(f"[{signer.username}] 当前积分: {credits}")
+        return {"status": "success", "credits": credits}
+
+def enabled_tasks():
+    """按配置tasks创建已启用的任务实例"""
+    tasks = []
+    for name, options in config_manager.get_config().get('tasks', {}).items():
+        if not options.get('enabled', False):
+            continue
+        try:
+            task_class = load_task_class(name, options)
+        except Exception as e:
+            logger.error(f"加载任务 {name} 失败: {str(e)}")
+            continue
+        if task_class is None:
+            logger.error(f"未知的任务: {name}")
+            continue
+        task = task_class(options)
+        # 通过class配置的任务以配置中的名称记录
+        task.name = name
+        tasks.append(task)
+    return tasks
+
+def run_tasks(signer, tasks=None):
+    """在签到后的已登录会话中依次执行附加任务，结果记录到历史记录
+
+    单个任务失败不影响其他任务和签到结果；超出时间预算时该任务记录为timeout，
+    并停止执行剩余任务，已完成的签到不会因此变为失败。
+
+    Returns:
+        dict: {任务名: 任务结果}
+    """
+    tasks = enabled_tasks() if tasks is None else tasks
+    results = {}
+    for task in tasks:
+        if task.once_per_day and history_manager.task_done_today(signer.username, task.name):
+            logger.info(f"[{signer.username}] 任务 {task.name} 今日已完成，跳过")
+            continue
+
+        logger.info(f"[{signer.username}] 正在执行任务: {task.name}")
+        deadline_exceeded = False
+        with profiler.phase(signer.username, f'task:{task.name}'), \
+                event_log.phase(signer.username, f'task:{task.name}') as phase:
+            try:
+                result = task.run(signer) or {"status": "success"}
+            except DeadlineExceeded:
+                logger.warning(f"[{signer.username}] 任务 {task.name} 超出时间预算，停止执行剩余任务")
+                result = {"status": "timeout", "error": "DeadlineExceeded"}
+                deadline_exceeded = True
+            except (Timeout, ConnectionError) as e:
+                logger.warning(f"[{signer.username}] 任务 {task.name} 网络错误: {str(e)}")
+                result = {"status": "failed", "error": type(e).__name__}
+            except Exception as e:
+                logger.error(f"[{signer.username}] 任务 {task.name} 执行失败: {str(e)}")
+                result = {"status": "failed", "error": type(e).__name__}
+            phase.update(status=result.get('status', 'success'), error=result.get('error'))
+
+        history_manager.add_task_record(signer.username, task.name, result)
+        results[task.name] = result
+        if deadline_exceeded:
+            break
+    return results